@@ -12,7 +12,7 @@
 
 from pims.frame import Frame
 from pims.base_frames import FramesSequence, index_attr
-from pims.utils.misc import FileLocker
+from pims.utils.misc import FileLocker, pread, fields_size, unpack_fields
 import time
 import struct
 import numpy as np
@@ -22,11 +22,13 @@ import datetime
 import hashlib
 import warnings
 from collections.abc import Iterable
+from functools import lru_cache
 
 __all__ = ('Cine', )
 
 
 # '<' for little endian (cine documentation)
+@lru_cache(maxsize=None)
 def _build_struct(dtype):
     return struct.Struct(str("<" + dtype))
 
@@ -51,6 +53,12 @@ WBGAIN = '2f'
 IMFILTER = '28i'
 # TODO: get correct format for TrigTC
 TC = '8s'
+# size, type and 'more tags' flag of a tagged block
+TAG_BLOCK_HEADER = UINT32 + UINT16 + UINT16
+
+# Number of bytes read at once when opening a file. This usually covers
+# the header, bitmap info and setup.
+HEAD_READ_SIZE = 16 * 2 ** 10
 
 CFA_NONE = 0    # gray sensor
 CFA_VRI = 1     # gbrg/rggb sensor
@@ -323,14 +331,19 @@ class Cine(FramesSequence):
     Read cine files, the out put from Vision Research high-speed phantom
     cameras.  Support uncompressed monochrome and color files.
 
-    Nominally thread-safe, but this assertion is not tested.
-
+    A reader can be shared between threads.
 
     Parameters
     ----------
     filename : string
         Path to cine (or chd) file.
-    
+    mmap : boolean, optional
+        If True, memory-map the file and return frames as read-only views
+        into it instead of reading them through the shared file handle.
+        Frames of uncompressed 8 and 16 bit files are then returned without
+        any copy, and several threads can read frames without waiting on
+        each other. Defaults to False.
+
     Notes
     -----
     For a .chd file, this class only reads the header, not the images.
@@ -343,12 +356,18 @@ class Cine(FramesSequence):
     propagate_attrs = ['frame_shape', 'pixel_type', 'filename', 'frame_rate',
                        'get_fps', 'compression', 'cfa', 'off_set']
 
-    def __init__(self, filename):
+    def __init__(self, filename, mmap=False):
         super(Cine, self).__init__()
         self.f = open(filename, 'rb')
         self._filename = filename
+        self._mmap = None
+
+        # Allows Cine object to be accessed from multiple threads!
+        self.file_lock = Lock()
 
         ### HEADER
+        # read the start of the file at once: it usually holds all headers
+        self._head = pread(self.f, HEAD_READ_SIZE, 0, self.file_lock)
         self.header_dict = self._read_header(HEADER_FIELDS)
         self.bitmapinfo_dict = self._read_header(BITMAP_INFO_FIELDS,
                                                 self.off_image_header)
@@ -359,9 +378,6 @@ class Cine(FramesSequence):
         self._height = self.bitmapinfo_dict['bi_height']
         self._pixel_count = self._width * self._height
 
-        # Allows Cine object to be accessed from multiple threads!
-        self.file_lock = Lock()
-
         self._hash = None
 
         self._im_sz = (self._width, self._height)
@@ -371,9 +387,24 @@ class Cine(FramesSequence):
             self._data_type = 'u1'
         else:
             self._data_type = 'u2'
-        self.tagged_blocks = self._read_tagged_blocks()
-        self.frame_time_stamps = self.tagged_blocks['image_time_only']
-        self.all_exposures = self.tagged_blocks['exposure_only']
+        # the tagged blocks lie between the setup and the image offsets
+        tags_start = self.off_setup + self.setup_length
+        tags_size = self.off_image_offsets - tags_start
+        offsets_size = 8 * self.image_count
+        if tags_size > 0:
+            # read them and the image offsets that follow them in one go
+            data = self._read_bytes(tags_start, tags_size + offsets_size)
+            tags_data, offsets_data = data[:tags_size], data[tags_size:]
+        else:
+            tags_data = b''
+            offsets_data = self._read_bytes(self.off_image_offsets,
+                                            offsets_size)
+        self._head = None
+        # tagged blocks are kept as raw arrays, and only converted to
+        # datetimes or seconds when asked for
+        self._raw_tagged_blocks = self._read_tagged_blocks(tags_data)
+        self._tagged_blocks = None
+        self._times_to_trigger = None
         self.stack_meta_data = dict()
         self.stack_meta_data.update(self.bitmapinfo_dict)
         self.stack_meta_data.update({k: self.setup_fields_dict[k]
@@ -395,14 +426,13 @@ class Cine(FramesSequence):
         self.stack_meta_data['trigger_time'] = self.trigger_time
 
         ### IMAGES
-        # Move to images offset to test EOF...
-        self.f.seek(self.off_image_offsets)
-        if self.f.read(1) != b'':
+        # Test EOF at the images offset...
+        if len(offsets_data) > 0:
             # ... If no, read images
-            self.image_locations = self._unpack('%dQ' % self.image_count,
-                                               self.off_image_offsets)
-            if type(self.image_locations) not in (list, tuple):
-                self.image_locations = [self.image_locations]
+            self.image_locations = frombuffer(offsets_data, '<u8',
+                                              self.image_count).tolist()
+            if mmap:
+                self._mmap = np.memmap(filename, dtype='u1', mode='r')
         # TODO: add support for reading sequence within the same framework, when data
         # has been saved in another format (.tif, image sequence, etc)
 
@@ -515,167 +545,340 @@ class Cine(FramesSequence):
         W, H = self.frame_shape
         return self.len(), H, W
 
+    @property
+    def tagged_blocks(self):
+        """Tagged block meta-data, with times converted to tuples of
+        (datetime_object, fraction_in_s) and exposures to seconds.
+
+        This is built on first access: `times_to_trigger` and `exposures`
+        are much faster for long movies."""
+        if self._tagged_blocks is None:
+            blocks = dict()
+            for name, data in self._raw_tagged_blocks.items():
+                if name in ('image_time_only', 'image_time_total'):
+                    data = [_decode_time64(d) for d in data.tolist()]
+                elif name == 'exposure_only':
+                    data = (data / MAX_INT).tolist()
+                blocks[name] = data
+            self._tagged_blocks = blocks
+        return self._tagged_blocks
+
+    @property
+    def frame_time_stamps(self):
+        """List of (datetime_object, fraction_in_s) for each frame."""
+        return self.tagged_blocks['image_time_only']
+
+    @property
+    def all_exposures(self):
+        """Exposure time of each frame (s)."""
+        return self.exposures()
+
+    def exposures(self):
+        """Return an array with the exposure time (s) of each frame."""
+        return self._raw_tagged_blocks['exposure_only'] / MAX_INT
+
+    def times_to_trigger(self):
+        """Return an array with the time (s) of each frame, relative to
+        the trigger."""
+        if self._times_to_trigger is None:
+            times = self._raw_tagged_blocks['image_time_only']
+            trigger = self.header_dict['trigger_time']
+            seconds = (times >> 32).astype(np.int64) - (trigger >> 32)
+            fractions = ((times & FRACTION_MASK).astype(np.int64) -
+                         (trigger & FRACTION_MASK))
+            self._times_to_trigger = seconds + fractions / MAX_INT
+        return self._times_to_trigger
+
     def get_frame(self, j):
         md = dict()
-        md['exposure'] = self.all_exposures[j]
-        ts, sec_frac = self.frame_time_stamps[j]
+        raw_time = int(self._raw_tagged_blocks['image_time_only'][j])
+        ts, sec_frac = _decode_time64(raw_time)
+        md['exposure'] = float(
+            self._raw_tagged_blocks['exposure_only'][j]) / MAX_INT
         md['frame_time'] = {'datetime': ts,
                             'second_fraction': sec_frac,
                             'time_to_trigger': self.get_time_to_trigger(j),
                             }
         return Frame(self._get_frame(j), frame_no=j, metadata=md)
 
-    def _unpack(self, fs, offset=None):
-        if offset is not None:
-            self.f.seek(offset)
-        s = _build_struct(fs)
-        vals = s.unpack(self.f.read(s.size))
-        if len(vals) == 1:
-            return vals[0]
-        else:
-            return vals
-
-    def _read_tagged_blocks(self):
-        """Reads the tagged block meta-data from the header."""
+    def _read_tagged_blocks(self, data):
+        """Reads the tagged block meta-data from the bytes `data` that
+        follow the setup."""
         tmp_dict = dict()
-        if not self.off_setup + self.setup_length < self.off_image_offsets:
-            return
-        next_tag_exists = True
+        next_tag_exists = len(data) > 0
         next_tag_offset = 0
-        while next_tag_exists:
-            block_size, next_tag_exists = self._read_tag_block(next_tag_offset,
-                                                               tmp_dict)
+        while next_tag_exists and next_tag_offset + 8 <= len(data):
+            block_size, next_tag_exists = self._read_tag_block(
+                data, next_tag_offset, tmp_dict)
             next_tag_offset += block_size
         return tmp_dict
 
-    def _read_tag_block(self, off_set, accum_dict):
+    def _read_tag_block(self, data, off_set, accum_dict):
         '''
         Internal helper-function for reading the tagged blocks.
         '''
-        with FileLocker(self.file_lock):
-            self.f.seek(self.off_setup + self.setup_length + off_set)
-            block_size = self._unpack(UINT32)
-            b_type = self._unpack(UINT16)
-            more_tags = self._unpack(UINT16)
+        block_size, b_type, more_tags = _build_struct(TAG_BLOCK_HEADER) \
+            .unpack_from(data, off_set)
 
-            if b_type == 1004:
-                # docs say to ignore range data it seems to be a poison flag,
-                # if see this, give up tag parsing
-                return block_size, 0
-
-            try:
-                d_name, d_type = TAGGED_FIELDS[b_type]
+        if b_type == 1004:
+            # docs say to ignore range data it seems to be a poison flag,
+            # if see this, give up tag parsing
+            return block_size, 0
 
-            except KeyError:
-                return block_size, more_tags
-
-            if d_type == '':
-                # print "can't deal with  <" + d_name + "> tagged data"
-                return block_size, more_tags
+        try:
+            d_name, d_type = TAGGED_FIELDS[b_type]
 
-            s_tmp = _build_struct(d_type)
-            if (block_size-8) % s_tmp.size != 0:
-                #            print 'something is wrong with your data types'
-                return block_size, more_tags
+        except KeyError:
+            return block_size, more_tags
 
-            d_count = (block_size-8)//(s_tmp.size)
+        if d_type == '':
+            # print "can't deal with  <" + d_name + "> tagged data"
+            return block_size, more_tags
 
-            data = self._unpack('%d' % d_count + d_type)
-            if not isinstance(data, tuple):
-                # fix up data due to design choice in self.unpack
-                data = (data, )
+        s_tmp = _build_struct(d_type)
+        if (block_size-8) % s_tmp.size != 0:
+            #            print 'something is wrong with your data types'
+            return block_size, more_tags
 
-            # parse time
-            if b_type == 1002 or b_type == 1001:
-                data = [(datetime.datetime.fromtimestamp(d >> 32),
-                         (FRACTION_MASK & d)/MAX_INT) for d in data]
-            # convert exposure to seconds
-            if b_type == 1003:
-                data = [d/(MAX_INT) for d in data]
+        d_count = (block_size-8)//(s_tmp.size)
 
-            accum_dict[d_name] = data
+        # keep the raw values; they are converted when needed
+        accum_dict[d_name] = frombuffer(data, '<' + d_type, d_count,
+                                        off_set + 8)
 
         return block_size, more_tags
 
     def _read_header(self, fields, offset=0):
-        self.f.seek(offset)
-        tmp = dict()
-        for name, format in fields:
-            val = self._unpack(format)
-            tmp[name] = val
+        return unpack_fields(fields,
+                             self._read_bytes(offset, fields_size(fields)))
+
+    def _read_bytes(self, offset, size):
+        """Read `size` bytes at `offset`, from the start of the file read
+        when opening it if possible."""
+        if self._head is not None and offset + size <= len(self._head):
+            return self._head[offset:offset + size]
+        return pread(self.f, size, offset, self.file_lock)
+
+    def get_frames(self, indices, out=None):
+        """Read several frames at once into a single array.
 
-        return tmp
+        The frames are read in file order, and frames that are stored next
+        to each other in the file are read with a single call. This is much
+        faster than reading the frames one by one on slow or network drives.
+
+        Parameters
+        ----------
+        indices : iterable of int
+            Frame numbers to read. Negative numbers count from the end.
+        out : ndarray, optional
+            Array of shape ``(len(indices),) + self.shape[1:]`` (with an
+            extra axis of size 3 for color files) and dtype `pixel_type`.
+            If given, the frames are written into it.
+
+        Returns
+        -------
+        frames : ndarray
+            The frames, stacked along the first axis in the requested order.
+        """
+        indices = np.asarray(indices, dtype=np.intp).reshape(-1)
+        count = len(self)
+        indices = np.where(indices < 0, indices + count, indices)
+        if np.any((indices < 0) | (indices >= count)):
+            raise IndexError("Frame number out of range.")
+
+        shape = (len(indices), self._height, self._width)
+        if self.cfa != CFA_NONE:
+            shape += (3, )
+        if out is None:
+            out = np.empty(shape, dtype=self.pixel_type)
+        elif out.shape != shape:
+            raise ValueError("out should have shape {}".format(shape))
+
+        # read each distinct frame once, in file order
+        unique, inverse = np.unique(indices, return_inverse=True)
+        first = np.empty(len(unique), dtype=np.intp)
+        first[inverse[::-1]] = np.arange(len(indices))[::-1]
+
+        if self._mmap is not None:
+            for i, dest in zip(unique, first):
+                out[dest] = self._get_frame_mmap(i)
+        else:
+            for run, layout in self._frame_runs(unique):
+                self._read_run(run, layout,
+                               first[np.searchsorted(unique, run)], out)
+
+        # fill in frames that were requested more than once
+        duplicate = first[inverse] != np.arange(len(indices))
+        if np.any(duplicate):
+            out[duplicate] = out[first[inverse[duplicate]]]
+        return out
+
+    def _frame_layout(self, number):
+        """Return (annotation_size, image_size) of frame `number`."""
+        image_start = self.image_locations[number]
+        annotation_size = self._pread_uint32(image_start)
+        image_size = self._pread_uint32(image_start + annotation_size - 4)
+        return annotation_size, image_size
+
+    def _pread_uint32(self, offset):
+        return _build_struct(UINT32).unpack(
+            pread(self.f, 4, offset, self.file_lock))[0]
+
+    def _frame_runs(self, numbers):
+        """Split sorted frame numbers into runs of frames that are stored
+        back to back in the file. Yields lists of frame numbers, with the
+        (annotation_size, image_size) layout of their first frame."""
+        run = []
+        layout = None
+        run_stride = 0
+        for number in numbers:
+            if run:
+                expected = self.image_locations[run[-1]] + run_stride
+                if (self.image_locations[number] == expected and
+                        len(run) * run_stride < MAX_RUN_BYTES):
+                    run.append(number)
+                    continue
+                yield run, layout
+            run = [number]
+            layout = self._frame_layout(number)
+            run_stride = sum(layout)
+        if run:
+            yield run, layout
+
+    def _read_run(self, run, layout, destinations, out):
+        """Read the frames in `run`, which have the (annotation_size,
+        image_size) `layout`, with a single read and decode them into `out`
+        at `destinations`."""
+        start = self.image_locations[run[0]]
+        annotation_size, image_size = layout
+        stride = annotation_size + image_size
+        buf = pread(self.f, self.image_locations[run[-1]] + stride - start,
+                    start, self.file_lock)
+
+        # check that every frame in the run has the same layout
+        headers = np.ndarray((len(run), 2), dtype='<u4', buffer=buf,
+                             strides=(stride, annotation_size - 4))
+        if not (np.all(headers[:, 0] == annotation_size) and
+                np.all(headers[:, 1] == image_size)):
+            for number, dest in zip(run, destinations):
+                out[dest] = self._get_frame(number)
+            return
+
+        actual_bits, data_type = self._pixel_format(image_size)
+        itemsize = np.dtype(data_type).itemsize
+        data = np.ndarray((len(run), image_size // itemsize), dtype=data_type,
+                          buffer=buf, offset=annotation_size,
+                          strides=(stride, itemsize))
+
+        d0 = destinations[0]
+        if np.array_equal(destinations, np.arange(d0, d0 + len(run))):
+            self._decode_frames(data, actual_bits, out[d0:d0 + len(run)])
+        else:
+            out[destinations] = self._decode_frames(data, actual_bits)
 
     def _get_frame(self, number):
-        with FileLocker(self.file_lock):
-            # get basic information about the frame we want
-            image_start = self.image_locations[number]
-            annotation_size = self._unpack(UINT32, image_start)
-            # this is not used, but is needed to advance the point in the file
-            annotation = self._unpack('%db' % (annotation_size - 8))
-            image_size = self._unpack(UINT32)
-
-            cfa = self.cfa
-            compression = self.compression
-
-            # sort out data type looking at the cached version
-            data_type = self._data_type
-
-            # actual bit per pixel
-            actual_bits = image_size * 8 // (self._pixel_count)
-
-            # so this seem wrong as 10 or 12 bits won't fit in 'u1'
-            # but I (TAC) may not understand and don't have a packed file
-            # (which the docs seem to imply don't exist) to test on so
-            # I am leaving it.  good luck.
+        if self._mmap is not None:
+            return self._get_frame_mmap(number)
+
+        # get basic information about the frame we want
+        image_start = self.image_locations[number]
+        annotation_size, image_size = self._frame_layout(number)
+
+        # suck the data out of the file and shove into linear
+        # numpy array
+        actual_bits, data_type = self._pixel_format(image_size)
+        data = frombuffer(pread(self.f, image_size,
+                                image_start + annotation_size,
+                                self.file_lock), data_type)
+
+        return self._decode_frames(data, actual_bits)
+
+    def _get_frame_mmap(self, number):
+        """Return frame `number` as a view into the memory-mapped file.
+
+        No lock is needed: nothing here depends on a shared file position.
+        """
+        image_start = self.image_locations[number]
+        annotation_size = self._mmap_uint32(image_start)
+        # the image size is the last field of the annotation
+        image_size = self._mmap_uint32(image_start + annotation_size - 4)
+        data_start = image_start + annotation_size
+        actual_bits, data_type = self._pixel_format(image_size)
+        data = self._mmap[data_start:data_start + image_size].view(data_type)
+        return self._decode_frames(data, actual_bits)
+
+    def _mmap_uint32(self, offset):
+        return int(self._mmap[offset:offset + 4].view('<u4')[0])
+
+    def _pixel_format(self, image_size):
+        """Return the actual bits per pixel and the data type in which the
+        image data is stored, given the size of an image in bytes."""
+        # actual bit per pixel
+        actual_bits = image_size * 8 // (self._pixel_count)
+
+        # packed 10 or 12 bit data is read as bytes, then unpacked
+        if actual_bits in (10, 12):
+            return actual_bits, 'u1'
+        # sort out data type looking at the cached version
+        return actual_bits, self._data_type
+
+    def _decode_frames(self, data, actual_bits, out=None):
+        """Convert the raw data of one or more images into arrays of pixels.
+
+        `data` has shape (..., values per image) and the data type returned
+        by `_pixel_format`. Uncompressed 8 and 16 bit data is returned as a
+        view on `data`, unless `out` is given; packed data is unpacked into
+        `out` or into a new array.
+        """
+        cfa = self.cfa
+        compression = self.compression
+        lead = data.shape[:-1]
+
+        # if mono-camera
+        if cfa == CFA_NONE:
+            if compression != 0:
+                raise ValueError("Can not deal with compressed files\n" +
+                                 "compression level: " +
+                                 "{}".format(compression))
+            # we are working with a monochrome camera
+            # un-pack packed data, which is stored with rows in order
             if actual_bits in (10, 12):
-                data_type = 'u1'
-
-            # move the file to the right point in the file
-            self.f.seek(image_start + annotation_size)
-
-            # suck the data out of the file and shove into linear
-            # numpy array
-            frame = frombuffer(self.f.read(image_size), data_type)
-
-            # if mono-camera
-            if cfa == CFA_NONE:
-                if compression != 0:
-                    raise ValueError("Can not deal with compressed files\n" +
-                                     "compression level: " +
-                                     "{}".format(compression))
-                # we are working with a monochrome camera
-                # un-pack packed data
-                if (actual_bits == 10):
-                    frame = _ten2sixteen(frame)
-                elif (actual_bits == 12):
-                    frame = _twelve2sixteen(frame)
-                elif (actual_bits % 8):
-                    raise ValueError('Data should be byte aligned, ' +
-                         'or 10 or 12 bit packed (appears to be' +
-                        ' %dbits/pixel?!)' % actual_bits)
-
-                # re-shape to an array
-                # flip the rows
-                frame = frame.reshape(self._height, self._width)[::-1]
-
-                if actual_bits in (10, 12):
-                    frame = frame[::-1, :]
-                    # Don't know why it works this way, but it does...
-            # else, some sort of color layout
+                unpack = _ten2sixteen if actual_bits == 10 else _twelve2sixteen
+                if out is not None and out.flags.c_contiguous:
+                    unpack(data, out)
+                    return out
+                frame = unpack(data).reshape(lead + (self._height,
+                                                     self._width))
+                if out is not None:
+                    out[...] = frame
+                    return out
+                return frame
+            elif (actual_bits % 8):
+                raise ValueError('Data should be byte aligned, ' +
+                     'or 10 or 12 bit packed (appears to be' +
+                    ' %dbits/pixel?!)' % actual_bits)
+
+            # re-shape to an array
+            # flip the rows
+            frame = data.reshape(lead + (self._height, self._width))
+            frame = frame[..., ::-1, :]
+        # else, some sort of color layout
+        else:
+            if compression == 0:
+                # and re-order so color is RGB (naively saves as BGR)
+                frame = data.reshape(lead + (self._height, self._width, 3))
+                frame = frame[..., ::-1, :, ::-1]
+            elif compression == 2:
+                raise ValueError("Can not process un-interpolated movies")
             else:
-                if compression == 0:
-                    # and re-order so color is RGB (naively saves as BGR)
-                    frame = frame.reshape(self._height, self._width,
-                                          3)[::-1, :, ::-1]
-                elif compression == 2:
-                    raise ValueError("Can not process un-interpolated movies")
-                else:
-                    raise ValueError("Should never hit this, " +
-                                     "you have an un-documented file\n" +
-                                     "compression level: " +
-                                     "{}".format(compression))
-
+                raise ValueError("Should never hit this, " +
+                                 "you have an un-documented file\n" +
+                                 "compression level: " +
+                                 "{}".format(compression))
+
+        if out is not None:
+            out[...] = frame
+            return out
         return frame
 
     def __len__(self):
@@ -694,11 +897,7 @@ class Cine(FramesSequence):
     @index_attr
     def get_time_to_trigger(self, i):
         """Get actual time (s) of frame i, relative to trigger."""
-        ti = self.frame_time_stamps[i]
-        ti = ti[0].timestamp() + ti[1]
-        tt= self.trigger_time
-        tt = tt['datetime'].timestamp() + tt['second_fraction']
-        return ti - tt
+        return self.times_to_trigger()[i]
 
     def get_frame_rate_avg(self, error_tol=1e-3):
         """Compute mean frame rate (Hz), on the basis of frame time stamps.
@@ -714,8 +913,7 @@ class Cine(FramesSequence):
         fps : float.
             Actual mean frame rate, based on the frames time stamps.
         """
-        times = np.r_[[self.get_time_to_trigger(i) for i in range(self.len())]]
-        freqs = 1 / np.diff(times)
+        freqs = 1 / np.diff(self.times_to_trigger())
         fps, std = freqs.mean(), freqs.std()
         error = std / fps
         if error > error_tol:
@@ -741,6 +939,7 @@ class Cine(FramesSequence):
 
     def close(self):
         self.f.close()
+        self._mmap = None
 
     def __del__(self):
         if hasattr(self, 'f'):
@@ -767,10 +966,7 @@ Pixel Datatype: {dtype}""".format(frame_shape=self.frame_shape,
     def trigger_time(self):
         '''Returns the time of the trigger, tuple of (datatime_object,
         fraction_in_s)'''
-        trigger_time = self.header_dict['trigger_time']
-        ts, sf = (datetime.datetime.fromtimestamp(trigger_time >> 32),
-                   float(FRACTION_MASK & trigger_time)/(MAX_INT))
-
+        ts, sf = _decode_time64(self.header_dict['trigger_time'])
         return {'datetime': ts, 'second_fraction': sf}
 
     @property
@@ -814,24 +1010,58 @@ Pixel Datatype: {dtype}""".format(frame_shape=self.frame_shape,
 # Should be divisible by 3, 4 and 5!  This seems to be near-optimal.
 CHUNK_SIZE = 6 * 10 ** 5
 
+# Upper bound on the size of a single read in Cine.get_frames
+MAX_RUN_BYTES = 64 * 2 ** 20
 
-def _ten2sixteen(a):
-    """Convert array of 10bit uints to array of 16bit uints."""
-    b = np.zeros(a.size//5*4, dtype='u2')
 
-    for j in range(0, len(a), CHUNK_SIZE):
-        (a0, a1, a2, a3, a4) = [a[j+i:j+CHUNK_SIZE:5].astype('u2')
-                                for i in range(5)]
+def _unpack_target(a, out, group_in, group_out):
+    """Prepare unpacking of `a`, whose last axis holds groups of `group_in`
+    packed bytes, into `group_out` values per group.
 
-        k = j//5 * 4
-        k2 = k + CHUNK_SIZE//5 * 4
+    Returns `a` and `out` (allocated if None) as 2D arrays with one frame
+    per row, and the number of groups per frame. `out` is returned as
+    given, for the caller to pass back.
+    """
+    lead = a.shape[:-1]
+    n = a.shape[-1] // group_in
+    if out is None:
+        out = np.empty(lead + (n * group_out, ), dtype='u2')
+    rows = out.reshape(-1, n * group_out)
+    if rows.strides[-1] != 2 or not np.may_share_memory(rows, out):
+        raise ValueError("out should be a contiguous array of "
+                         "{} uint16 values".format(rows.size))
+    return a.reshape(-1, a.shape[-1]), rows, n, out
+
+
+def _packed_pairs(row, offset, step, n):
+    """View `n` big-endian uint16 values starting at byte `offset` of `row`,
+    one every `step` bytes. Each of them holds a packed value in its bits."""
+    if not row.flags.c_contiguous:
+        row = np.ascontiguousarray(row)
+    return np.ndarray((n, ), dtype='>u2', buffer=row, offset=offset,
+                      strides=(step, ))
+
+
+def _ten2sixteen(a, out=None):
+    """Convert array of 10bit uints to array of 16bit uints.
+
+    The packed bytes are along the last axis of `a`; leading axes (e.g.
+    several frames) are unpacked in one go. The result is written into
+    `out` if given, which avoids allocating a new array for every frame.
+    """
+    a, b, n, out = _unpack_target(a, out, 5, 4)
 
-        b[k+0:k2:4] = ((a0 & 0b11111111) << 2) + ((a1 & 0b11000000) >> 6)
-        b[k+1:k2:4] = ((a1 & 0b00111111) << 4) + ((a2 & 0b11110000) >> 4)
-        b[k+2:k2:4] = ((a2 & 0b00001111) << 6) + ((a3 & 0b11111100) >> 2)
-        b[k+3:k2:4] = ((a3 & 0b00000011) << 8) + ((a4 & 0b11111111) >> 0)
+    # each value spans two bytes of a 5 byte group: read those two bytes
+    # as one big-endian uint16 and shift the value into place
+    for row, res in zip(a, b):
+        res = res.reshape(n, 4)
+        np.right_shift(_packed_pairs(row, 0, 5, n), 6, out=res[:, 0])
+        for i, shift in ((1, 4), (2, 2)):
+            np.right_shift(_packed_pairs(row, i, 5, n), shift, out=res[:, i])
+            res[:, i] &= 0x3FF
+        np.bitwise_and(_packed_pairs(row, 3, 5, n), 0x3FF, out=res[:, 3])
 
-    return b
+    return out
 
 
 def _sixteen2ten(b):
@@ -853,20 +1083,22 @@ def _sixteen2ten(b):
     return a
 
 
-def _twelve2sixteen(a):
-    """Convert array of 12bit uints to array of 16bit uints."""
-    b = np.zeros(a.size//3*2, dtype='u2')
-
-    for j in range(0, len(a), CHUNK_SIZE):
-        (a0, a1, a2) = [a[j+i:j+CHUNK_SIZE:3].astype('u2') for i in range(3)]
+def _twelve2sixteen(a, out=None):
+    """Convert array of 12bit uints to array of 16bit uints.
 
-        k = j//3 * 2
-        k2 = k + CHUNK_SIZE//3 * 2
+    The packed bytes are along the last axis of `a`; leading axes (e.g.
+    several frames) are unpacked in one go. The result is written into
+    `out` if given, which avoids allocating a new array for every frame.
+    """
+    a, b, n, out = _unpack_target(a, out, 3, 2)
 
-        b[k+0:k2:2] = ((a0 & 0xFF) << 4) + ((a1 & 0xF0) >> 4)
-        b[k+1:k2:2] = ((a1 & 0x0F) << 8) + ((a2 & 0xFF) >> 0)
+    # see _ten2sixteen
+    for row, res in zip(a, b):
+        res = res.reshape(n, 2)
+        np.right_shift(_packed_pairs(row, 0, 3, n), 4, out=res[:, 0])
+        np.bitwise_and(_packed_pairs(row, 1, 3, n), 0x0FFF, out=res[:, 1])
 
-    return b
+    return out
 
 
 def _sixteen2twelve(b):
@@ -886,6 +1118,13 @@ def _sixteen2twelve(b):
     return a
 
 
+def _decode_time64(t):
+    """Convert a TIME64 value to a tuple of (datetime_object, fraction_in_s)
+    """
+    return (datetime.datetime.fromtimestamp(t >> 32),
+            (FRACTION_MASK & t) / MAX_INT)
+
+
 def _convert_null_byte(dic):
     """
     Convert binary null character b'\x00' to empty string in dictionary entries.
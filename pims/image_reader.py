@@ -1,7 +1,10 @@
+import os
+
 import numpy as np
 
 from pims.base_frames import FramesSequence, FramesSequenceND
 from pims.frame import Frame
+from pims.utils.probe import probe_image
 
 try:
     from skimage.io import imread
@@ -15,51 +18,97 @@ except ImportError:
         return np.asarray(iio.imread(*args, **kwargs))
 
 
+class _LazyImage(object):
+    """Shape and dtype of an image and its data. If `lazy`, the shape and
+    dtype are read from the file header where possible, and the data is
+    decoded when first asked for."""
+    def __init__(self, filename, lazy=False, **kwargs):
+        self._filename = filename
+        self._kwargs = kwargs
+        self._data = None
+        probed = None
+        # reader options may change what the decoder returns, and an open
+        # file may be closed before the image is read
+        if lazy and isinstance(filename, (str, os.PathLike)) and not kwargs:
+            probed = probe_image(filename)
+        if probed is None:
+            probed = self.data.shape, self.data.dtype
+        self.shape, self.dtype = probed
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = imread(self._filename, **self._kwargs)
+        return self._data
+
+
 class ImageReader(FramesSequence):
     """Reads a single image into a length-1 reader.
 
     Simple wrapper around skimage.io.imread or matplotlib.pyplot.imread,
-    in that priority order."""
+    in that priority order.
+
+    Parameters
+    ----------
+    filename : string
+    lazy : boolean, optional
+        If True, the image is decoded when it is first read, rather than
+        when the reader is opened, if its shape and data type can be found
+        in the file header. Default False.
+    **kwargs
+        Passed to imread.
+    """
     @classmethod
     def class_exts(cls):
         return {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'ico'}
 
     class_priority = 12
 
-    def __init__(self, filename, **kwargs):
-        self._data = imread(filename, **kwargs)
+    def __init__(self, filename, lazy=False, **kwargs):
+        self._image = _LazyImage(filename, lazy, **kwargs)
 
     def get_frame(self, i):
-        return Frame(self._data, frame_no=0)
+        return Frame(self._image.data, frame_no=0)
 
     def __len__(self):
         return 1
 
     @property
     def pixel_type(self):
-        return self._data.dtype
+        return self._image.dtype
 
     @property
     def frame_shape(self):
-        return self._data.shape
+        return self._image.shape
 
 
 class ImageReaderND(FramesSequenceND):
     """Reads a single image into a dimension-aware reader.
 
     Simple wrapper around skimage.io.imread or matplotlib.pyplot.imread,
-    in that priority order."""
+    in that priority order.
+
+    Parameters
+    ----------
+    filename : string
+    lazy : boolean, optional
+        If True, the image is decoded when it is first read, rather than
+        when the reader is opened, if its shape and data type can be found
+        in the file header. Default False.
+    **kwargs
+        Passed to imread.
+    """
     @classmethod
     def class_exts(cls):
         return {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'ico'}
 
     class_priority = 11
 
-    def __init__(self, filename, **kwargs):
+    def __init__(self, filename, lazy=False, **kwargs):
         super(ImageReaderND, self).__init__()
 
-        self._data = Frame(imread(filename, **kwargs), frame_no=0)
-        shape = self._data.shape
+        self._image = _LazyImage(filename, lazy, **kwargs)
+        shape = self._image.shape
         if len(shape) == 2:   # greyscale
             self._init_axis('y', shape[0])
             self._init_axis('x', shape[1])
@@ -76,12 +125,12 @@ class ImageReaderND(FramesSequenceND):
                           ' {}'.format(shape))
 
     def get_frame_2D(self, **ind):
-        return Frame(self._data, frame_no=0)
+        return Frame(self._image.data, frame_no=0)
 
     @property
     def pixel_type(self):
-        return self._data.dtype
+        return self._image.dtype
 
     @property
     def frame_shape(self):
-        return self._data.shape
+        return self._image.shape
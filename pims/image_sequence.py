@@ -5,15 +5,20 @@ from warnings import warn
 import re
 import zipfile
 from io import BytesIO
-from functools import partial
+from functools import partial, lru_cache
+from collections import OrderedDict
+from threading import Lock
 
 import numpy as np
 
 import pims
 from pims.base_frames import FramesSequence, FramesSequenceND
 from pims.frame import Frame
-from pims.image_reader import imread
-from pims.utils.sort import natural_keys
+from pims.image_reader import imread, ImageReaderND
+from pims.utils.sort import natural_sort
+from pims.utils.prefetch import Prefetcher
+from pims.utils.probe import probe_image
+from pims.utils.sidecar import sidecar_path, load_sidecar, save_sidecar
 
 
 class ImageSequence(FramesSequence):
@@ -31,6 +36,15 @@ class ImageSequence(FramesSequence):
         Passed on to skimage.io.imread if scikit-image is available.
         If scikit-image is not available, this will be ignored and a warning
         will be issued. Not available in combination with zipfiles.
+    prefetch : integer, optional
+        If larger than 0, after frame j is requested, frames j + 1 up to
+        j + `prefetch` are decoded in advance by a pool of `prefetch`
+        worker threads. This speeds up sequential access when decoding is
+        the bottleneck. Default 0 (no prefetching).
+    cache_index : boolean, optional
+        If True, save the sorted list of files next to their directory (see
+        `pims.utils.sidecar`), so that opening the sequence again does not
+        list the directory while it is unchanged. Default False.
 
     Examples
     --------
@@ -51,7 +65,9 @@ class ImageSequence(FramesSequence):
     >>> frame_count = len(video) # Number of frames in video
     >>> frame_shape = video.frame_shape # Pixel dimensions of video
     """
-    def __init__(self, path_spec, plugin=None):
+    def __init__(self, path_spec, plugin=None, prefetch=0, cache_index=False):
+        self._prefetcher = None
+        self._cache_index = cache_index
         if not imread.__module__.startswith("skimage"):
             if plugin is not None:
                 warn("A plugin was specified but ignored. Plugins can only "
@@ -65,12 +81,20 @@ class ImageSequence(FramesSequence):
         self._zipfile = None
         self._get_files(path_spec)
 
-        tmp = self.imread(self._filepaths[0], **self.kwargs)
-        self._first_frame_shape = tmp.shape
-        self._dtype = tmp.dtype
+        probed = self._probe(self._filepaths[0])
+        if probed is None:
+            tmp = self.imread(self._filepaths[0], **self.kwargs)
+            probed = tmp.shape, tmp.dtype
+        self._first_frame_shape, self._dtype = probed
+
+        if prefetch > 0:
+            self._prefetcher = Prefetcher(self._read_file, self._count,
+                                          prefetch)
 
     def close(self):
-        if self._is_zipfile:
+        if getattr(self, '_prefetcher', None) is not None:
+            self._prefetcher.close()
+        if getattr(self, '_is_zipfile', False):
             self._zipfile.close()
         super(ImageSequence, self).close()
 
@@ -84,6 +108,17 @@ class ImageSequence(FramesSequence):
         else:
             return imread(filename, **kwargs)
 
+    def _probe(self, filename):
+        """Read the shape and dtype of an image from its header, or return
+        None if they can only be known by decoding it."""
+        if (self.kwargs.get('plugin') is not None or
+                type(self).imread is not ImageSequence.imread):
+            return None
+        if self._is_zipfile:
+            with self._zipfile.open(filename) as file_handle:
+                return probe_image(file_handle)
+        return probe_image(filename)
+
     def _get_files(self, path_spec):
         # deal with if input is _not_ a string
         if not isinstance(path_spec, str):
@@ -98,7 +133,7 @@ class ImageSequence(FramesSequence):
             self._zipfile = zipfile.ZipFile(path_spec, 'r')
             filepaths = [fn for fn in self._zipfile.namelist()
                          if fnmatch.fnmatch(fn, '*.*')]
-            self._filepaths = sorted(filepaths, key=natural_keys)
+            self._filepaths = natural_sort(filepaths)
             self._count = len(self._filepaths)
             if 'plugin' in self.kwargs and self.kwargs['plugin'] is not None:
                 warn("A plugin cannot be combined with reading from an "
@@ -106,18 +141,7 @@ class ImageSequence(FramesSequence):
             return
 
         self.pathname = os.path.abspath(path_spec)  # used by __repr__
-        if os.path.isdir(path_spec):
-            warn("Loading ALL files in this directory. To ignore extraneous "
-                 "files, use a pattern like 'path/to/images/*.png'",
-                 UserWarning)
-            directory = path_spec
-            filenames = os.listdir(directory)
-            make_full_path = lambda filename: (
-                os.path.abspath(os.path.join(directory, filename)))
-            filepaths = list(map(make_full_path, filenames))
-        else:
-            filepaths = glob.glob(path_spec)
-        self._filepaths = sorted(filepaths, key=natural_keys)
+        self._filepaths = _list_files(path_spec, self._cache_index)
         self._count = len(self._filepaths)
 
         # If there were no matches, this was probably a user typo.
@@ -127,9 +151,15 @@ class ImageSequence(FramesSequence):
     def get_frame(self, j):
         if j > self._count:
             raise ValueError("File does not contain this many frames")
-        res = self.imread(self._filepaths[j], **self.kwargs)
+        if self._prefetcher is not None:
+            res = self._prefetcher.get(j)
+        else:
+            res = self._read_file(j)
         return Frame(res, frame_no=j)
 
+    def _read_file(self, j):
+        return self.imread(self._filepaths[j], **self.kwargs)
+
     def __len__(self):
         return self._count
 
@@ -157,6 +187,52 @@ Pixel Datatype: {dtype}""".format(frame_shape=self.frame_shape,
                                   dtype=self.pixel_type)
 
 
+def _list_files(path_spec, cache_index=False):
+    """List the files in a directory, or matching a glob pattern, in natural
+    order (see `pims.utils.sort.natural_sort`).
+
+    The directory is read with a single `os.scandir` pass. With
+    `cache_index`, the list is saved next to the directory and reused while
+    the directory is unchanged.
+    """
+    if os.path.isdir(path_spec):
+        warn("Loading ALL files in this directory. To ignore extraneous "
+             "files, use a pattern like 'path/to/images/*.png'",
+             UserWarning)
+        directory, pattern = path_spec, None
+    else:
+        directory, pattern = os.path.split(path_spec)
+        if glob.has_magic(directory):
+            return natural_sort(glob.glob(path_spec))
+        if not os.path.isdir(directory or os.curdir):
+            return []
+
+    source = directory or os.curdir
+    cache_path = sidecar_path(source, 'listing')
+    if cache_index:
+        cached = load_sidecar(cache_path, source, ('path_spec', 'filepaths'))
+        if cached is not None and str(cached['path_spec']) == path_spec:
+            return cached['filepaths'].tolist()
+
+    with os.scandir(source) as entries:
+        names = [entry.name for entry in entries]
+    if pattern is None:
+        prefix = os.path.abspath(directory)
+    else:
+        prefix = directory
+        # like glob, wildcards do not match hidden files
+        if not pattern.startswith('.'):
+            names = [name for name in names if not name.startswith('.')]
+        names = fnmatch.filter(names, pattern)
+    filepaths = natural_sort([os.path.join(prefix, name) for name in names])
+
+    if cache_index and filepaths:
+        save_sidecar(cache_path, source,
+                     path_spec=np.array(path_spec),
+                     filepaths=np.array(filepaths))
+    return filepaths
+
+
 def filename_to_indices(filename, identifiers='tzc'):
     """ Find ocurrences of axis indices (e.g. t001, z06, c2)
     in a filename and returns a list of indices.
@@ -174,19 +250,19 @@ def filename_to_indices(filename, identifiers='tzc'):
         axis indices. Elements default to 0 when index was not found.
 
     """
-    escaped = [re.escape(a) for a in identifiers]
-    axes = re.findall('(' + '|'.join(escaped) + r')(\d+)',
-                            filename)
+    axes = _axis_indices_regex(tuple(identifiers)).findall(filename)
     if len(axes) > len(identifiers):
         axes = axes[-3:]
-    order = [a[0] for a in axes]
-    result = [0] * len(identifiers)
-    for (i, col) in enumerate(identifiers):
-        try:
-            result[i] = int(axes[order.index(col)][1])
-        except ValueError:
-            result[i] = 0
-    return result
+    found = dict()
+    for name, index in axes:
+        found.setdefault(name, int(index))
+    return [found.get(name, 0) for name in identifiers]
+
+
+@lru_cache(maxsize=None)
+def _axis_indices_regex(identifiers):
+    escaped = [re.escape(a) for a in identifiers]
+    return re.compile('(' + '|'.join(escaped) + r')(\d+)')
 
 
 class ReaderSequence(FramesSequenceND):
@@ -203,8 +279,19 @@ class ReaderSequence(FramesSequenceND):
         identifier such as: 'file_t001c05z32'.
     axis_name : string, optional
         The name of the added axis. Default 't'.
+    pool_size : int, optional
+        Number of child readers kept open between reads, so that reading
+        several frames from one file opens it once. The least recently
+        used reader is closed first. Default 4. With 0, a file is opened
+        for each frame read from it.
+    **kwargs
+        Passed to `reader_cls`.
     """
-    def __init__(self, path_spec, reader_cls=None, axis_name='t', **kwargs):
+    def __init__(self, path_spec, reader_cls=None, axis_name='t',
+                 pool_size=4, **kwargs):
+        self._pool = OrderedDict()
+        self._pool_lock = Lock()
+        self._pool_size = pool_size
         FramesSequenceND.__init__(self)
 
         self.kwargs = kwargs
@@ -214,7 +301,12 @@ class ReaderSequence(FramesSequenceND):
             self.reader_cls = reader_cls
         self._get_files(path_spec)
 
-        with self.reader_cls(self._filepaths[0], **self.kwargs) as reader:
+        first_kwargs = self.kwargs
+        if (isinstance(self.reader_cls, type) and
+                issubclass(self.reader_cls, ImageReaderND)):
+            # only the shape and dtype of the first image are needed
+            first_kwargs = dict(self.kwargs, lazy=True)
+        with self.reader_cls(self._filepaths[0], **first_kwargs) as reader:
             if not isinstance(reader, FramesSequenceND):
                 raise ValueError("Reader is not subclass of FramesSequenceND")
             for ax in reader.axes:
@@ -247,21 +339,63 @@ class ReaderSequence(FramesSequenceND):
 
     def _get_seq_frame(self, **coords):
         i = coords.pop(self._imseq_axis)
-        with self.reader_cls(self._filepaths[i], **self.kwargs) as reader:
-            # check whether the reader has the expected shape
-            for ax in self.sizes:
-                if ax == self._imseq_axis:
-                    continue
-                if ax not in reader.sizes:
-                    raise RuntimeError('{} does not have '
-                                       'axis {}'.format(self._filepaths[i], ax))
-                if reader.sizes[ax] != self.sizes[ax]:
-                    raise RuntimeError('In {}, the size of axis {} was unexpect'
-                                       'ed'.format(self._filepaths[i], ax))
-            reader.bundle_axes = self.bundle_axes
+        reader = self._checkout_reader(i)
+        try:
+            if reader.bundle_axes != self.bundle_axes:
+                reader.bundle_axes = self.bundle_axes
             result = reader._get_frame_wrapped(**coords)
+        except Exception:
+            reader.close()
+            raise
+        self._checkin_reader(i, reader)
         return result
 
+    def _open_reader(self, i):
+        reader = self.reader_cls(self._filepaths[i], **self.kwargs)
+        # check whether the reader has the expected shape
+        for ax in self.sizes:
+            if ax == self._imseq_axis:
+                continue
+            if ax not in reader.sizes:
+                reader.close()
+                raise RuntimeError('{} does not have '
+                                   'axis {}'.format(self._filepaths[i], ax))
+            if reader.sizes[ax] != self.sizes[ax]:
+                reader.close()
+                raise RuntimeError('In {}, the size of axis {} was unexpect'
+                                   'ed'.format(self._filepaths[i], ax))
+        return reader
+
+    def _checkout_reader(self, i):
+        """Take the reader of file i out of the pool, or open it. A reader
+        is only used by one thread at a time."""
+        with self._pool_lock:
+            reader = self._pool.pop(i, None)
+        if reader is None:
+            reader = self._open_reader(i)
+        return reader
+
+    def _checkin_reader(self, i, reader):
+        """Put the reader of file i back in the pool, closing the least
+        recently used reader if the pool is full."""
+        with self._pool_lock:
+            if self._pool_size > 0 and i not in self._pool:
+                self._pool[i] = reader
+                reader = None
+                if len(self._pool) > self._pool_size:
+                    _, reader = self._pool.popitem(last=False)
+        if reader is not None:
+            reader.close()
+
+    def close(self):
+        with self._pool_lock:
+            readers = list(self._pool.values())
+            self._pool.clear()
+            self._pool_size = 0
+        for reader in readers:
+            reader.close()
+        super(ReaderSequence, self).close()
+
     @property
     def pixel_type(self):
         return self._pixel_type
@@ -282,7 +416,7 @@ class ReaderSequence(FramesSequenceND):
         # deal with if input is _not_ a string
         if not isinstance(path_spec, str):
             # assume it is iterable and off we go!
-            self._filepaths = sorted(list(path_spec), key=natural_keys)
+            self._filepaths = natural_sort(path_spec)
             self._count = len(path_spec)
             return
 
@@ -292,7 +426,7 @@ class ReaderSequence(FramesSequenceND):
             self._zipfile = zipfile.ZipFile(path_spec, 'r')
             filepaths = [fn for fn in self._zipfile.namelist()
                          if fnmatch.fnmatch(fn, '*.*')]
-            self._filepaths = sorted(filepaths, key=natural_keys)
+            self._filepaths = natural_sort(filepaths)
             self._count = len(self._filepaths)
             if 'plugin' in self.kwargs and self.kwargs['plugin'] is not None:
                 warn("A plugin cannot be combined with reading from an "
@@ -300,18 +434,7 @@ class ReaderSequence(FramesSequenceND):
             return
 
         self.pathname = os.path.abspath(path_spec)  # used by __repr__
-        if os.path.isdir(path_spec):
-            warn("Loading ALL files in this directory. To ignore extraneous "
-                 "files, use a pattern like 'path/to/images/*.png'",
-                 UserWarning)
-            directory = path_spec
-            filenames = os.listdir(directory)
-            make_full_path = lambda filename: (
-                os.path.abspath(os.path.join(directory, filename)))
-            filepaths = list(map(make_full_path, filenames))
-        else:
-            filepaths = glob.glob(path_spec)
-        self._filepaths = sorted(filepaths, key=natural_keys)
+        self._filepaths = _list_files(path_spec)
         self._count = len(self._filepaths)
 
         # If there were no matches, this was probably a user typo.
@@ -410,14 +533,20 @@ class ImageSequenceND(FramesSequenceND, ImageSequence):
 
     def _get_files(self, path_spec):
         super(ImageSequenceND, self)._get_files(path_spec)
-        self._toc = np.array([filename_to_indices(f, self.axes_identifiers)
-                              for f in self._filepaths])
-        for n, name in enumerate(self.axes_identifiers):
-            if np.all(self._toc[:, n] == 0):
-                self._toc = np.delete(self._toc, n, axis=1)
-            else:
-                self._toc[:, n] = self._toc[:, n] - min(self._toc[:, n])
-                self._init_axis(name, max(self._toc[:, n]) + 1)
+        toc = np.array([filename_to_indices(f, self.axes_identifiers)
+                        for f in self._filepaths], dtype=np.int64)
+        toc = toc.reshape(len(self._filepaths), len(self.axes_identifiers))
+        # axes that are not in the filenames are left out
+        kept = np.any(toc != 0, axis=0)
+        self._toc_axes = [name for name, keep
+                          in zip(self.axes_identifiers, kept) if keep]
+        self._toc = toc[:, kept] - toc[:, kept].min(axis=0)
+        for name, size in zip(self._toc_axes, self._toc.max(axis=0) + 1):
+            self._init_axis(name, int(size))
+        # map coordinates to the first file that has them
+        self._toc_index = dict()
+        for i, coords in enumerate(map(tuple, self._toc.tolist())):
+            self._toc_index.setdefault(coords, i)
         self._filepaths = np.array(self._filepaths)
 
     def get_frame(self, i):
@@ -425,12 +554,12 @@ class ImageSequenceND(FramesSequenceND, ImageSequence):
         return Frame(frame, frame_no=i)
 
     def get_frame_2D(self, **ind):
-        if self.is_rgb:
-            c = ind['c']
-            row = [ind[name] for name in self.axes_identifiers if name != 'c']
-        else:
-            row = [ind[name] for name in self.axes_identifiers]
-        i = np.argwhere(np.all(self._toc == row, 1))[0, 0]
+        coords = tuple(int(ind[name]) for name in self._toc_axes)
+        try:
+            i = self._toc_index[coords]
+        except KeyError:
+            raise IndexError("No file for coordinates {}".format(
+                dict(zip(self._toc_axes, coords))))
         return self.imread(self._filepaths[i], **self.kwargs)
 
     def __repr__(self):
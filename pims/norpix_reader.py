@@ -6,13 +6,21 @@ Based heavily on cine.py by Kleckner and Caswell
 
 from pims.frame import Frame
 from pims.base_frames import FramesSequence, index_attr
-from pims.utils.misc import FileLocker
+from pims.utils.misc import pread, pread_into, fields_size, unpack_fields
+from pims.utils.sidecar import sidecar_path, load_sidecar, save_sidecar
 import os, struct, itertools
 from warnings import warn
 import datetime
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from threading import Lock
 
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
 __all__ = ['NorpixSeq',]
 
 DWORD = 'L'
@@ -57,8 +65,12 @@ class NorpixSeq(FramesSequence):
     This is the native format of StreamPix software, owned by NorPix Inc.
     The format is described in the StreamPix documentation.
 
-    Currently only supports uncompressed files (with the same number
-    of bytes for each frame).
+    Uncompressed files store every frame in a block of the same size.
+    Compressed files (JPEG or PNG frames, which require Pillow) have
+    variable-size frames: on first open, an index of frame offsets is
+    built by walking the frame records, or read from the ``.idx`` file
+    that StreamPix writes next to the sequence. With `cache_index`, the
+    index built is saved next to the file to make later opens fast.
 
     Only unsigned 8, 16 or 32 bit monochrome files are directly supported.
     Other color and monochrome pixel formats can be handled by setting
@@ -66,7 +78,7 @@ class NorpixSeq(FramesSequence):
     and the correct number of rows.  (If a raw frame size in bytes is not
     evenly divisible by the number of rows, a 1-D array is returned).
 
-    Nominally thread-safe.
+    A reader can be shared between threads, for compressed files too.
 
     Parameters
     ----------
@@ -77,6 +89,11 @@ class NorpixSeq(FramesSequence):
         Images will be returned as an ndarray of bytes.
         2-dimensional if the image height evenly divides the bytes per image,
         1-dimensional otherwise.
+        Ignored for compressed files.
+    cache_index : boolean, optional
+        For compressed files, whether to save the frame index next to the
+        file (see `pims.utils.sidecar`) and reuse it while the file is
+        unchanged. Default False. Failing to save it is not an error.
     """
     @classmethod
     def class_exts(cls):
@@ -86,18 +103,21 @@ class NorpixSeq(FramesSequence):
                        'get_time_float', 'filename', 'width', 'height',
                        'frame_rate']
 
-    def __init__(self, filename, as_raw=False):
+    def __init__(self, filename, as_raw=False, cache_index=False):
         super(NorpixSeq, self).__init__()
         self._file = open(filename, 'rb')
         self._filename = filename
+        self._file_lock = Lock()
 
         self.header_dict = self._read_header(HEADER_FIELDS)
 
         if self.header_dict['magic'] != 0xFEED:
             raise IOError('The format of this .seq file is unrecognized')
-        if self.header_dict['compression_format'] != 0:
-            raise IOError('Only uncompressed images are supported in .seq files')
-        if self.header_dict['image_format'] != 100 and not as_raw:
+        self._compressed = self.header_dict['compression_format'] != 0
+        if self._compressed and Image is None:
+            raise IOError('Reading compressed .seq files requires Pillow')
+        if (self.header_dict['image_format'] != 100 and not as_raw
+                and not self._compressed):
             raise IOError('Non-monochrome images are only supported as_raw in .seq files')
 
         # File-level metadata
@@ -113,14 +133,27 @@ class NorpixSeq(FramesSequence):
             self._timestamp_micro = False
         self._image_block_size = self.header_dict['true_image_size']
         self._filesize = os.stat(self._filename).st_size
-        self._image_count = int((self._filesize - self._image_offset) /
-                                self._image_block_size)
+        self._mmap = None
+        if self._compressed:
+            self._frame_offsets, self._frame_sizes = \
+                self._load_frame_index(cache_index)
+            self._image_count = len(self._frame_offsets)
+        else:
+            self._image_count = int((self._filesize - self._image_offset) /
+                                    self._image_block_size)
 
         # Image metadata
         self._width = self.header_dict['width']
         self._height = self.header_dict['height']
         self._image_bytes = self.header_dict['image_size_bytes']
-        if as_raw:
+        if self._compressed:
+            if self._image_count == 0:
+                raise IOError('No frames found in compressed .seq file')
+            first = self._decode_image(self._read_record(0)[0])
+            self._shape = first.shape
+            self._dtype = first.dtype
+            self._pixel_count = first.size
+        elif as_raw:
             self._pixel_count = self._image_bytes
             if self._pixel_count % self._height == 0:
                 self._shape = (self._height, int(self._pixel_count / self._height))
@@ -142,26 +175,9 @@ class NorpixSeq(FramesSequence):
                           'suggested_frame_rate', 'width', 'height')}
         self.metadata['gamut'] = 2**self.metadata['bit_depth_real'] - 1
 
-        self._file_lock = Lock()
-
     def _read_header(self, fields, offset=0):
-        self._file.seek(offset)
-        tmp = dict()
-        for name, format in fields:
-            val = self._unpack(format)
-            tmp[name] = val
-
-        return tmp
-
-    def _unpack(self, fs, offset=None):
-        if offset is not None:
-            self._file.seek(offset)
-        s = struct.Struct('<' + fs)
-        vals = s.unpack(self._file.read(s.size))
-        if len(vals) == 1:
-            return vals[0]
-        else:
-            return vals
+        data = pread(self._file, fields_size(fields), offset, self._file_lock)
+        return unpack_fields(fields, data)
 
     def _verify_frame_no(self, i):
         if int(i) != i:
@@ -176,36 +192,159 @@ class NorpixSeq(FramesSequence):
 
     def get_frame(self, i):
         self._verify_frame_no(i)
-        with FileLocker(self._file_lock):
-            self._file.seek(self._image_offset + self._image_block_size * i)
-            imdata = np.fromfile(self._file, self.pixel_type, self._pixel_count
-                                 ).reshape(self._shape)
-            # Timestamp immediately follows
-            tfloat, ts = self._read_timestamp()
-            md = {'time': ts, 'time_float': tfloat,
-                  'gamut': self.metadata['gamut']}
-            return Frame(imdata, frame_no=i, metadata=md)
-
-    def _read_timestamp(self):
-        """Read a timestamp at the current position in the file.
+        if self._compressed:
+            data, ts_data = self._read_record(i)
+            return self._make_frame(i, self._decode_image(data), ts_data)
+        # Read the image and the timestamp that immediately follows it
+        # in one go
+        dtype = np.dtype(self.pixel_type)
+        nbytes = self._pixel_count * dtype.itemsize
+        buf = np.empty(nbytes + self._timestamp_struct.size, dtype=np.uint8)
+        count = pread_into(self._file, buf,
+                           self._image_offset + self._image_block_size * i,
+                           self._file_lock)
+        if count < buf.nbytes:
+            raise IOError("Frame {} is truncated in the file.".format(i))
+        imdata = buf[:nbytes].view(dtype).reshape(self._shape)
+        return self._make_frame(i, imdata, buf[nbytes:].tobytes())
+
+    def _make_frame(self, i, imdata, ts_data):
+        tfloat, ts = self._read_timestamp(ts_data)
+        md = {'time': ts, 'time_float': tfloat,
+              'gamut': self.metadata['gamut']}
+        return Frame(imdata, frame_no=i, metadata=md)
+
+    def get_frames(self, indices, max_workers=None):
+        """Read several frames into one array of shape
+        ``(len(indices),) + frame shape``.
+
+        Compressed frames are decoded in a pool of `max_workers` threads
+        (by default, as many as ``concurrent.futures`` chooses).
+        No per-frame metadata is returned.
+        """
+        indices = np.asarray(indices, dtype=np.intp).ravel()
+        indices = np.where(indices < 0, indices + len(self), indices)
+        for i in indices:
+            self._verify_frame_no(i)
+        out = np.empty((len(indices),) + self._shape, dtype=self._dtype)
+        if not self._compressed:
+            out[:] = self.as_array()[indices]
+            return out
+
+        def decode(k):
+            out[k] = self._decode_image(self._read_record(indices[k])[0])
+
+        with ThreadPoolExecutor(max_workers) as executor:
+            # consume the results to propagate exceptions
+            for _ in executor.map(decode, range(len(indices))):
+                pass
+        return out
+
+    def _read_record(self, i):
+        """Read the compressed image data and the timestamp bytes of
+        frame i, in one go."""
+        offset, size = int(self._frame_offsets[i]), int(self._frame_sizes[i])
+        data = pread(self._file, size + self._timestamp_struct.size - 4,
+                     offset + 4, self._file_lock)
+        return data[:size - 4], data[size - 4:]
+
+    @staticmethod
+    def _decode_image(data):
+        with Image.open(BytesIO(data)) as im:
+            return np.asarray(im)
+
+    def _load_frame_index(self, cache_index):
+        """Return the offsets and sizes of the records of a compressed file.
+
+        Each record is a DWORD holding its size (including the DWORD
+        itself), the compressed image, and a timestamp.
+        """
+        cache_path = sidecar_path(self._filename)
+        if cache_index:
+            cached = load_sidecar(cache_path, self._filename,
+                                  ('offsets', 'sizes'))
+            if cached is not None:
+                return cached['offsets'], cached['sizes']
+        index = self._read_idx_file()
+        if index is None:
+            index = self._walk_frame_records()
+        if cache_index:
+            save_sidecar(cache_path, self._filename,
+                         offsets=index[0], sizes=index[1])
+        return index
+
+    def _read_idx_file(self):
+        """Read the frame index StreamPix saves as <filename>.idx.
+
+        Its records are 24 bytes long and start with the offset (8 bytes)
+        and size (4 bytes) of a frame. The index is checked against the
+        sequence; None is returned if it is missing or does not match.
+        """
+        idx_dtype = np.dtype({'names': ['offset', 'size'],
+                              'formats': ['<u8', '<u4'],
+                              'offsets': [0, 8], 'itemsize': 24})
+        try:
+            idx = np.fromfile(self._filename + '.idx', dtype=idx_dtype)
+        except (OSError, ValueError):
+            return None
+        offsets = idx['offset'].astype(np.int64)
+        sizes = idx['size'].astype(np.int64)
+        if (len(idx) == 0 or offsets[0] != self._image_offset
+                or np.any(np.diff(offsets) <= sizes[:-1])
+                or offsets[-1] + sizes[-1] > self._filesize):
+            return None
+        mm = self._get_mmap()
+        first_size = mm[offsets[0]:offsets[0] + 4].view('<u4')[0]
+        if first_size != sizes[0]:
+            return None
+        return offsets, sizes
+
+    def _walk_frame_records(self):
+        mm = self._get_mmap()
+        max_count = self.header_dict['allocated_frames'] or None
+        # after the image data there are 8 bytes for the timestamp, even
+        # if it uses fewer; some versions pad every record with 8 more.
+        extra = 8
+        offsets, sizes = [], []
+        pos = self._image_offset
+        while pos + 4 <= self._filesize and len(offsets) != max_count:
+            size = int(mm[pos:pos + 4].view('<u4')[0])
+            if size <= 4 or pos + size > self._filesize:
+                break
+            offsets.append(pos)
+            sizes.append(size)
+            pos += size + extra
+            if len(offsets) == 1 and pos + 4 <= self._filesize and \
+                    mm[pos:pos + 4].view('<u4')[0] == 0:
+                extra += 8
+                pos += 8
+        return (np.array(offsets, dtype=np.int64),
+                np.array(sizes, dtype=np.int64))
+
+    def _read_timestamp(self, data):
+        """Decode a timestamp from the bytes that follow an image.
 
         Returns a floating-point representation in seconds, and a datetime instance.
         """
         if self._timestamp_micro:
-            tsecs, tms, tus = self._timestamp_struct.unpack(self._file.read(8))
+            tsecs, tms, tus = self._timestamp_struct.unpack(data)
             tfloat = tsecs + float(tms) / 1000. + float(tus) / 1.0e6
         else:
-            tsecs, tms = self._timestamp_struct.unpack(self._file.read(6))
+            tsecs, tms = self._timestamp_struct.unpack(data)
             tfloat = tsecs + float(tms) / 1000.
         return tfloat, datetime.datetime.fromtimestamp(tfloat)
 
     def _get_time(self, i):
         """Call _read_timestamp() for a given frame."""
         self._verify_frame_no(i)
-        with FileLocker(self._file_lock):
-            self._file.seek(self._image_offset + self._image_block_size * i
-                            + self._image_bytes)
-            return self._read_timestamp()
+        if self._compressed:
+            offset = self._frame_offsets[i] + self._frame_sizes[i]
+        else:
+            offset = (self._image_offset + self._image_block_size * i
+                      + self._image_bytes)
+        data = pread(self._file, self._timestamp_struct.size, int(offset),
+                     self._file_lock)
+        return self._read_timestamp(data)
 
     @index_attr
     def get_time(self, i):
@@ -224,7 +363,52 @@ class NorpixSeq(FramesSequence):
 
     def dump_times_float(self):
         """Return all frame times in file, as an array of floating-point numbers."""
-        return np.array([self._get_time(i)[0] for i in range(len(self))])
+        # view all timestamps at once; only the pages holding them are read
+        fields = ['seconds', 'milliseconds']
+        if self._timestamp_micro:
+            fields.append('microseconds')
+        ts_dtype = np.dtype({'names': fields,
+                             'formats': ['<u4', '<u2', '<u2'][:len(fields)],
+                             'offsets': [0, 4, 6][:len(fields)]})
+        if self._compressed:
+            # gather the bytes of every timestamp at once
+            positions = self._frame_offsets + self._frame_sizes
+            ts_bytes = self._get_mmap()[positions[:, np.newaxis] +
+                                        np.arange(ts_dtype.itemsize)]
+            ts = ts_bytes.view(ts_dtype)[:, 0]
+        else:
+            ts = self._strided_view(ts_dtype, (), self._image_bytes)
+        times = ts['seconds'] + ts['milliseconds'] / 1000.
+        if self._timestamp_micro:
+            times += ts['microseconds'] / 1.0e6
+        return times
+
+    def as_array(self):
+        """Return a read-only memory map of all frames, skipping the
+        timestamps stored between them. Compressed files raise ValueError:
+        use `get_frames` for those."""
+        if self._compressed:
+            raise ValueError('Compressed .seq files cannot be viewed as an '
+                             'array; use get_frames')
+        dtype = np.dtype(self.pixel_type)
+        if len(self._shape) == 2:
+            strides = (self._shape[1] * dtype.itemsize, dtype.itemsize)
+        else:
+            strides = (dtype.itemsize, )
+        return self._strided_view(dtype, strides, 0)
+
+    def _strided_view(self, dtype, strides, offset):
+        """View an item of `dtype` and shape self._shape (if `strides` is
+        not empty) at `offset` within every frame block of the file."""
+        shape = (len(self), ) + (self._shape if strides else ())
+        return np.ndarray(shape, dtype=dtype, buffer=self._get_mmap(),
+                          offset=self._image_offset + offset,
+                          strides=(self._image_block_size, ) + strides)
+
+    def _get_mmap(self):
+        if self._mmap is None:
+            self._mmap = np.memmap(self._filename, dtype=np.uint8, mode='r')
+        return self._mmap
 
     @property
     def filename(self):
@@ -244,6 +428,8 @@ class NorpixSeq(FramesSequence):
 
     @property
     def frame_shape(self):
+        if self._compressed:
+            return self._shape
         return (self.metadata['height'], self.metadata['width'])
 
     @property
@@ -255,6 +441,7 @@ class NorpixSeq(FramesSequence):
 
     def close(self):
         self._file.close()
+        self._mmap = None
 
     def __del__(self):
         if hasattr(self, '_file'):
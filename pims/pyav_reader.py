@@ -1,7 +1,13 @@
+import itertools
+import sys
+
 import numpy as np
 
 from pims.base_frames import FramesSequence
 from pims.frame import Frame
+from pims.utils.cache import FrameCache
+from pims.utils.prefetch import ReadAhead
+from pims.utils.sidecar import sidecar_path, load_sidecar, save_sidecar
 
 
 try:
@@ -14,37 +20,133 @@ def available():
     return av is not None
 
 
-def _next_video_packet(container_iter):
-    for packet in container_iter:
-        if packet.stream.type == 'video':
-            decoded = packet.decode()
-            if len(decoded) > 0:
-                return decoded
+# Codecs that store exactly one frame in each packet, so that the frames of a
+# video can be counted without decoding them.
+ONE_FRAME_PER_PACKET = {'h264', 'hevc', 'mjpeg', 'png', 'rawvideo',
+                        'prores', 'vp8', 'vp9', 'av1', 'ffv1', 'qtrle',
+                        'dnxhd', 'huffyuv', 'utvideo', 'tiff', 'gif'}
+
+
+# output format: (PyAV pixel format, data type). The 'y' format reads the
+# luma plane of YUV and grayscale videos as is, without conversion.
+OUTPUT_FORMATS = {
+    'rgb24': ('rgb24', np.uint8),
+    'gray': ('gray', np.uint8),
+    'gray16': ('gray16le' if sys.byteorder == 'little' else 'gray16be',
+               np.uint16),
+    'y': (None, np.uint8),
+    'yuv': ('yuv444p', np.uint8),
+}
+
+
+def _check_output_format(output_format):
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError("Unknown output format '{}', expected one of {}"
+                         .format(output_format, sorted(OUTPUT_FORMATS)))
+
+
+def _output_shape(output_format, height, width):
+    if output_format == 'rgb24':
+        return height, width, 3
+    if output_format == 'yuv':
+        return 3, height, width
+    return height, width
 
-    raise ValueError("Could not find any video packets.")
+
+def _has_luma_plane(frame):
+    """Whether the first plane of a frame holds its 8-bit luma."""
+    return (frame.format.name.startswith(('yuv', 'nv', 'gray')) and
+            frame.format.components[0].bits == 8)
+
+
+def _to_array(frame, output_format):
+    """Convert a decoded frame to an array that does not share the buffers
+    of the decoder."""
+    if output_format == 'y' and _has_luma_plane(frame):
+        plane = frame.planes[0]
+        luma = np.frombuffer(plane, np.uint8).reshape(-1, plane.line_size)
+        return np.array(luma[:frame.height, :frame.width])
+    pix_fmt = OUTPUT_FORMATS[output_format][0] or 'gray'
+    arr = frame.to_ndarray(format=pix_fmt)
+    # frames already in the output format are not converted, and may be
+    # views of a buffer that ffmpeg reuses
+    if frame.format.name == pix_fmt:
+        arr = np.array(arr)
+    return arr
+
+
+def _set_threading(stream, thread_type, thread_count):
+    """Configure the FFmpeg decoding threads of a stream, before it is
+    decoded."""
+    if thread_type is not None:
+        stream.thread_type = thread_type
+    if thread_count is not None:
+        stream.thread_count = thread_count
+
+
+def _decode_frames(demuxer):
+    for packet in demuxer:
+        for frame in packet.decode():
+            yield frame
+
+
+def _toc_from_packets(container, stream):
+    """Build a table of contents from the packet timestamps, without
+    decoding. Returns None if packets cannot be mapped to frames."""
+    if stream.codec_context.name not in ONE_FRAME_PER_PACKET:
+        return None
+    ts = []
+    keyframes = []
+    for packet in container.demux(stream):
+        if packet.size == 0 or getattr(packet, 'is_discard', False):
+            continue  # flush packet, or frame dropped by the decoder
+        if packet.pts is None:
+            return None
+        ts.append(packet.pts)
+        keyframes.append(packet.is_keyframe)
+    if len(ts) == 0:
+        return None
+    # packets are stored in decoding order, frames come in timestamp order
+    order = np.argsort(ts, kind='stable')
+    ts = np.asarray(ts)[order]
+    if np.any(np.diff(ts) == 0):
+        return None
+    return {'lengths': [1] * len(ts), 'ts': ts.tolist(),
+            'keyframes': np.asarray(keyframes)[order].tolist()}
+
+
+def _toc_from_frames(container, stream):
+    """Build a table of contents by decoding all frames."""
+    lengths = []
+    ts = []
+    keyframes = []
+    for packet in container.demux(stream):
+        decoded = packet.decode()
+        if len(decoded) > 0:
+            lengths.append(len(decoded))
+            ts.append(decoded[0].pts)
+            keyframes.append(bool(decoded[0].key_frame))
+    return {'lengths': lengths, 'ts': ts, 'keyframes': keyframes}
 
 
 class WrapPyAvFrame(object):
-    def __init__(self, frame, frame_no, metadata=None):
+    def __init__(self, frame, frame_no, metadata=None, output_format='rgb24'):
         self.frame_no = frame_no
-        self.arr = None
         self.metadata = metadata
+        self.data = _to_array(frame, output_format)
 
-        # makes a copy of the frame so that ffmpeg does not reuse the buffer
-        # by converting already to rgb24. rgb24 movies actually are converted
-        # twice. don't know how to just copy! But the operations are fast.
-        if frame.format.name == 'rgb24':
-            frame = frame.reformat(format="bgr24")
-        self.frame = frame.reformat(format="rgb24")
+    @property
+    def nbytes(self):
+        return self.data.nbytes
 
     def to_frame(self):
-        if self.arr is None:
-            self.arr = Frame(self.frame.to_ndarray(format='rgb24'),
-                             frame_no=self.frame_no, metadata=self.metadata)
-        return self.arr
+        # copy the data, so that the cached frame is not modified
+        return Frame(self.data.copy(), frame_no=self.frame_no,
+                     metadata=self.metadata)
 
 
-def _gen_frames(demuxer, time_base, frame_rate=1., first_pts=0):
+def _gen_frames(demuxer, time_base, frame_rate=1., first_pts=0,
+                output_format='rgb24'):
     for packet in demuxer:
         for frame in packet.decode():
             # learn timestamp
@@ -58,7 +160,8 @@ def _gen_frames(demuxer, time_base, frame_rate=1., first_pts=0):
             t = (timestamp - first_pts) * time_base
             i = int(round(t * frame_rate))
             yield WrapPyAvFrame(frame, frame_no=i,
-                                metadata=dict(timestamp=timestamp, t=float(t)))
+                                metadata=dict(timestamp=timestamp, t=float(t)),
+                                output_format=output_format)
 
 
 class PyAVReaderTimed(FramesSequence):
@@ -74,9 +177,37 @@ class PyAVReaderTimed(FramesSequence):
     filename : string
     cache_size : integer, optional
         the number of frames that are kept in memory. Default 16.
+    cache_bytes : integer, optional
+        the maximum size in bytes of the frames kept in memory, overriding
+        `cache_size`. The least recently used frames are dropped first.
+    thread_type : {'SLICE', 'FRAME', 'AUTO'}, optional
+        the kind of threading FFmpeg uses to decode the video. Frame
+        threading decodes several frames at once; it speeds up sequential
+        reading most but adds a delay after each seek. Default: that of
+        FFmpeg for the codec (usually 'SLICE').
+    thread_count : integer, optional
+        the number of decoding threads. 0 lets FFmpeg choose it from the
+        number of cores. Default: that of FFmpeg (usually 1).
+    decode_ahead : integer, optional
+        if positive, a background thread decodes up to this number of
+        frames ahead of the frame being read, so that decoding overlaps
+        with the processing of frames during sequential reading. Default 0.
+    output_format : {'rgb24', 'gray', 'gray16', 'y', 'yuv'}, optional
+        the pixel format of the frames. 'rgb24' gives (height, width, 3)
+        color frames. 'gray' and 'gray16' give (height, width) grayscale
+        frames of 8 and 16 bits, converted by FFmpeg. 'y' gives the luma
+        plane of YUV videos as stored, without any conversion (other
+        videos are converted as with 'gray'). 'yuv' gives (3, height,
+        width) frames of the Y, U and V planes, with the chroma planes
+        upsampled to full size. Default 'rgb24'.
     fast_forward_thresh : integer, optional
-        the reader will proceed through the frames if forwarding below this
-        number. If forwarding above this number, it will use seek(). Default 32.
+        until the keyframe index is built, the reader will proceed through
+        the frames if forwarding below this number. If forwarding above this
+        number, or backwards, the keyframe index is built by scanning the
+        packets of the file (without decoding them). From then on, the
+        reader proceeds through the frames if no keyframe lies between the
+        current and the requested frame, and seeks to the keyframe
+        preceding the requested frame otherwise. Default 32.
     stream_index : integer, optional
         the index of the video stream inside the file. rarely other than 0.
 
@@ -105,17 +236,25 @@ class PyAVReaderTimed(FramesSequence):
         return {'mov', 'avi', 'mp4'} | super(PyAVReaderTimed, cls).class_exts()
 
     def __init__(self, file, cache_size=16, fast_forward_thresh=32,
-                 stream_index=0, format=None):
+                 stream_index=0, format=None, cache_bytes=None,
+                 thread_type=None, thread_count=None, decode_ahead=0,
+                 output_format='rgb24'):
+        _check_output_format(output_format)
         if not hasattr(file, 'read'):
             file = str(file)
         self.file = file
         self.format = format
+        self._output_format = output_format
         self._container = av.open(self.file, format=self.format)
 
         if len(self._container.streams.video) == 0:
             raise IOError("No valid video stream found in {}".format(file))
 
+        self._stream_index = stream_index
         self._stream = self._container.streams.video[stream_index]
+        _set_threading(self._stream, thread_type, thread_count)
+        self._decode_ahead = decode_ahead
+        self._read_ahead = None
 
         try:
             self._duration = self._stream.duration * self._stream.time_base
@@ -126,19 +265,24 @@ class PyAVReaderTimed(FramesSequence):
         if self.duration <= 0 or len(self) <= 0:
             raise IOError("Video stream {} in {} has zero length.".format(stream_index, file))
 
-        self._cache = [None] * cache_size
         self._fast_forward_thresh = fast_forward_thresh
+        self._cache_size = cache_size
+        self._keyframes = None
 
         demuxer = self._container.demux(self._stream)
 
         # obtain first frame to get first time point
         # also tests for the presence of timestamps
-        frame = next(_gen_frames(demuxer, self._stream.time_base))
+        frame = next(_gen_frames(demuxer, self._stream.time_base,
+                                 output_format=output_format))
         self._first_pts = frame.metadata['timestamp']
 
-        frame = WrapPyAvFrame(frame.frame, 0, frame.metadata)
-        self._cache[0] = frame
-        self._frame_shape = (self._stream.height, self._stream.width, 3)
+        if cache_bytes is None:
+            cache_bytes = cache_size * frame.nbytes
+        self._cache = FrameCache(cache_bytes)
+        self._cache.put(0, frame)
+        self._frame_shape = _output_shape(output_format, self._stream.height,
+                                          self._stream.width)
         self._last_frame = 0
 
         self._reset_demuxer()
@@ -147,9 +291,27 @@ class PyAVReaderTimed(FramesSequence):
         return int(self._duration * self._frame_rate)
 
     def _reset_demuxer(self):
+        self._stop_decode_ahead()
         demuxer = self._container.demux(self._stream)
         self._frame_generator = _gen_frames(demuxer, self._stream.time_base,
-                                            self._frame_rate, self._first_pts)
+                                            self._frame_rate, self._first_pts,
+                                            self._output_format)
+        if self._decode_ahead > 0:
+            self._read_ahead = ReadAhead(self._frame_generator,
+                                         self._decode_ahead)
+            self._frame_generator = self._read_ahead
+
+    def _stop_decode_ahead(self):
+        """Stop decoding in the background, before the container is used
+        in this thread."""
+        if self._read_ahead is not None:
+            self._read_ahead.close()
+            self._read_ahead = None
+
+    def close(self):
+        self._stop_decode_ahead()
+        self._container.close()
+        super(PyAVReaderTimed, self).close()
 
     @property
     def duration(self):
@@ -164,20 +326,20 @@ class PyAVReaderTimed(FramesSequence):
     def frame_rate(self):
         return float(self._frame_rate)
 
-    def get_frame(self, i):
-        cached_frame = self._cache[i % len(self._cache)]
-        if cached_frame is None:
-            cached_i = -1
-        else:
-            cached_i = cached_frame.frame_no
+    @property
+    def cache(self):
+        """The cache of decoded frames (see `pims.utils.cache.FrameCache`),
+        which counts cache hits and misses."""
+        return self._cache
 
+    def get_frame(self, i):
         # return directly if the frame is in cache
-        if cached_i == i:
+        cached_frame = self._cache.get(i)
+        if cached_frame is not None:
             return cached_frame.to_frame()
 
         # check if we will have to seek to the frame
-        if self._last_frame >= i or \
-            self._last_frame < i - self._fast_forward_thresh:
+        if not self._is_ahead(i):
             frame = self.seek(i)
 
             # return directly if the seek was perfect (happens rarely)
@@ -189,7 +351,7 @@ class PyAVReaderTimed(FramesSequence):
         result = None
         for frame in self._frame_generator:
             # first cache the frame
-            self._cache[frame.frame_no % len(self._cache)] = frame
+            self._cache.put(frame.frame_no, frame)
             self._last_frame = frame.frame_no
 
             if frame.frame_no < i:
@@ -206,53 +368,104 @@ class PyAVReaderTimed(FramesSequence):
         if result is None:
             # the requested frame actually does not exist. Can occur due to
             # a bad file, or due to inaccuracy of reader length __len__.
-            # find it in the cache
-            for other_i in range(i - 1, i - len(self._cache), -1):
-                result = self._cache[other_i % len(self._cache)]
-                if result is None:
-                    continue
-                if result.frame_no < i:
-                    break
-            else:  # cache is empty: return an empty frame
+            # find the frame before it in the cache
+            earlier = [frame_no for frame_no in self._cache.keys()
+                       if i - self._cache_size < frame_no < i]
+            if not earlier:  # return an empty frame
                 return Frame(np.zeros(self.frame_shape, dtype=self.pixel_type),
                              frame_no=i)
+            result = self._cache.get(max(earlier))
 
         return result.to_frame()
 
+    def _is_ahead(self, i):
+        """Whether decoding on from the current position is the fastest way
+        to reach frame i."""
+        if self._last_frame >= i:
+            return False
+        if self._keyframes is None and \
+                self._last_frame >= i - self._fast_forward_thresh:
+            return True
+        # seeking would start decoding at this keyframe
+        return self._keyframe_before(i)[0] <= self._last_frame
+
+    def _build_keyframe_index(self):
+        """List the timestamps and frame numbers of the keyframes, from the
+        packet flags."""
+        if isinstance(self.file, str):
+            with av.open(self.file, format=self.format) as container:
+                stream = container.streams.video[self._stream_index]
+                timestamps = [packet.pts for packet in container.demux(stream)
+                              if packet.is_keyframe and packet.pts is not None]
+        else:
+            # the file cannot be opened twice: rewind once done
+            self._stop_decode_ahead()
+            timestamps = [packet.pts for packet in
+                          self._container.demux(self._stream)
+                          if packet.is_keyframe and packet.pts is not None]
+            self._container.seek(self._first_pts, stream=self._stream)
+            self._reset_demuxer()
+            self._last_frame = -1
+        timestamps = np.unique(timestamps)
+        frame_nos = [self._frame_no(ts) for ts in timestamps]
+        self._keyframes = timestamps, np.array(frame_nos, dtype=np.int64)
+
+    def _frame_no(self, timestamp):
+        t = (timestamp - self._first_pts) * self._stream.time_base
+        return int(round(t * self._frame_rate))
+
+    def _keyframe_before(self, i):
+        """Return the frame number and timestamp of the last keyframe at or
+        before frame i, or of the start of the video."""
+        if self._keyframes is None:
+            self._build_keyframe_index()
+        timestamps, frame_nos = self._keyframes
+        k = frame_nos.searchsorted(i, side='right')
+        if k == 0:
+            return 0, self._first_pts
+        return frame_nos[k - 1], timestamps[k - 1]
+
     def seek(self, i):
-        """Seek to a frame before i and return the first frame."""
-        # flush the cache
-        self._cache = [None] * len(self._cache)
+        """Seek to the keyframe preceding frame i and return the first
+        frame."""
         # the ffmpeg decode cache is flushed automatically
 
-        timestamp = int(i / (self._frame_rate * self._stream.time_base))
-        self._stream.container.seek(timestamp + self._first_pts)
-
-        # check the first frame
-        try:
-            frame = next(self._frame_generator)
-        except StopIteration:
+        keyframe_no, timestamp = self._keyframe_before(i)
+        while True:
+            self._stop_decode_ahead()
+            if timestamp is None:  # the start of the file
+                self._container.seek(0)
+            else:
+                self._container.seek(int(timestamp), stream=self._stream)
             self._reset_demuxer()
+
+            # check the first frame
             try:
                 frame = next(self._frame_generator)
             except StopIteration:
-                return None
-
-        if i == 0:  # security measure to avoid infinite recursion
-            return frame
+                self._reset_demuxer()
+                try:
+                    frame = next(self._frame_generator)
+                except StopIteration:
+                    return None
 
-        if frame.frame_no > i:
-            # recurse with an additional offset of 16 frames
-            return self.seek(i - 16)
+            if frame.frame_no <= i or timestamp is None:
+                break
+            # landed after frame i: go to the keyframe before, and at last
+            # to the start of the file
+            if keyframe_no > 0:
+                keyframe_no, timestamp = self._keyframe_before(keyframe_no - 1)
+            else:
+                timestamp = None
 
         # add the frame to the cache if succesful
-        self._cache[frame.frame_no % len(self._cache)] = frame
+        self._cache.put(frame.frame_no, frame)
         self._last_frame = frame.frame_no
         return frame
 
     @property
     def pixel_type(self):
-        return np.uint8
+        return OUTPUT_FORMATS[self._output_format][1]
 
     def __repr__(self):
         # May be overwritten by subclasses
@@ -275,9 +488,49 @@ class PyAVReaderIndexed(FramesSequence):
     """Read images from the frames of a standard video file into an
     iterable object that returns images as numpy arrays.
 
+    On opening, the file is scanned to build a table of contents (toc)
+    listing the timestamps of all frames. For codecs that store one frame
+    per packet, this only reads the packet headers; otherwise, the video is
+    decoded once. Frames are then found by seeking to the preceding keyframe
+    and decoding from there.
+
     Parameters
     ----------
     filename : string
+    toc : dict, optional
+        The table of contents of a previous reader of the same file (see
+        the `toc` property), so that the file is not scanned again.
+    format : string, optional
+        Container format, passed to `av.open`. Guessed by default.
+    cache_toc : boolean, optional
+        If True, save the table of contents next to the video (see
+        `pims.utils.sidecar`) and reuse it while the file is unchanged.
+        Default False.
+    cache_size : integer, optional
+        the number of frames that are kept in memory. Default 16.
+    cache_bytes : integer, optional
+        the maximum size in bytes of the frames kept in memory, overriding
+        `cache_size`. The least recently used frames are dropped first.
+    thread_type : {'SLICE', 'FRAME', 'AUTO'}, optional
+        the kind of threading FFmpeg uses to decode the video. Frame
+        threading decodes several frames at once; it speeds up sequential
+        reading most but adds a delay after each seek. Default: that of
+        FFmpeg for the codec (usually 'SLICE').
+    thread_count : integer, optional
+        the number of decoding threads. 0 lets FFmpeg choose it from the
+        number of cores. Default: that of FFmpeg (usually 1).
+    decode_ahead : integer, optional
+        if positive, a background thread decodes up to this number of
+        frames ahead of the frame being read, so that decoding overlaps
+        with the processing of frames during sequential reading. Default 0.
+    output_format : {'rgb24', 'gray', 'gray16', 'y', 'yuv'}, optional
+        the pixel format of the frames. 'rgb24' gives (height, width, 3)
+        color frames. 'gray' and 'gray16' give (height, width) grayscale
+        frames of 8 and 16 bits, converted by FFmpeg. 'y' gives the luma
+        plane of YUV videos as stored, without any conversion (other
+        videos are converted as with 'gray'). 'yuv' gives (3, height,
+        width) frames of the Y, U and V planes, with the chroma planes
+        upsampled to full size. Default 'rgb24'.
 
     Examples
     --------
@@ -305,44 +558,69 @@ class PyAVReaderIndexed(FramesSequence):
         return {'mov', 'avi',
                 'mp4'} | super(PyAVReaderIndexed, cls).class_exts()
 
-    def __init__(self, file, toc=None, format=None):
+    def __init__(self, file, toc=None, format=None, cache_toc=False,
+                 cache_size=16, cache_bytes=None, thread_type=None,
+                 thread_count=None, decode_ahead=0, output_format='rgb24'):
+        _check_output_format(output_format)
         if not hasattr(file, 'read'):
             file = str(file)
         self.file = file
         self.format = format
+        self._output_format = output_format
         self._container = None
+        self._threading = thread_type, thread_count
+        self._decode_ahead = decode_ahead
+        self._read_ahead = None
 
         with av.open(self.file, format=self.format) as container:
             stream = [s for s in container.streams if s.type == 'video'][0]
+            _set_threading(stream, *self._threading)
 
-            # Build a toc
             if toc is None:
-                packet_lengths = []
-                packet_ts = []
-                for packet in container.demux(stream):
-                    if packet.stream.type == 'video':
-                        decoded = packet.decode()
-                        if len(decoded) > 0:
-                            packet_lengths.append(len(decoded))
-                            packet_ts.append(decoded[0].pts)
-                self._toc = {
-                    'lengths': packet_lengths,
-                    'ts': packet_ts,
-                }
-            else:
-                self._toc = toc
+                toc = self._load_toc(container, stream, cache_toc)
+            self._toc = toc
 
             self._toc_cumsum = np.cumsum(self.toc['lengths'])
             self._len = self._toc_cumsum[-1]
+            # index of the first frame of each packet
+            self._toc_starts = self._toc_cumsum - self.toc['lengths']
+            keyframes = self.toc.get('keyframes')
+            if keyframes is not None:
+                self._keyframe_packets = np.flatnonzero(keyframes)
+            else:
+                self._keyframe_packets = None
 
-            # PyAV always returns frames in color, and we make that
-            # assumption in get_frame() later below, so 3 is hardcoded here:
-            self._im_sz = stream.height, stream.width, 3
+            self._im_sz = _output_shape(output_format, stream.height,
+                                        stream.width)
             self._time_base = stream.time_base
 
+        if cache_bytes is None:
+            cache_bytes = (cache_size * int(np.prod(self._im_sz)) *
+                           np.dtype(self.pixel_type).itemsize)
+        self._cache = FrameCache(cache_bytes)
         self._load_fresh_file()
 
+    def _load_toc(self, container, stream, cache_toc):
+        """Read the table of contents from the sidecar cache, or build it."""
+        cache_toc = cache_toc and isinstance(self.file, str)
+        if cache_toc:
+            cache_path = sidecar_path(self.file)
+            cached = load_sidecar(cache_path, self.file)
+            if cached is not None:
+                return {key: cached[key].tolist()
+                        for key in ('lengths', 'ts', 'keyframes')}
+
+        toc = _toc_from_packets(container, stream)
+        if toc is None:
+            container.seek(0)
+            toc = _toc_from_frames(container, stream)
+        if cache_toc:
+            save_sidecar(cache_path, self.file,
+                         **{key: np.asarray(toc[key]) for key in toc})
+        return toc
+
     def _load_fresh_file(self):
+        self._stop_decode_ahead()
         if self._container is not None:
             self._container.close()
 
@@ -350,9 +628,24 @@ class PyAVReaderIndexed(FramesSequence):
             self.file.seek(0)
 
         self._container = av.open(self.file, format=self.format)
-        demux = self._container.demux(self._video_stream)
-        self._current_packet = _next_video_packet(demux)
-        self._current_packet_no = 0
+        _set_threading(self._video_stream, *self._threading)
+        self._start_frames()
+        self._next_frame_no = 0
+
+    def _start_frames(self):
+        """Start decoding from the current position of the container."""
+        frames = _decode_frames(self._container.demux(self._video_stream))
+        if self._decode_ahead > 0:
+            self._read_ahead = ReadAhead(frames, self._decode_ahead)
+            frames = self._read_ahead
+        self._frames = frames
+
+    def _stop_decode_ahead(self):
+        """Stop decoding in the background, before the container is used
+        in this thread."""
+        if self._read_ahead is not None:
+            self._read_ahead.close()
+            self._read_ahead = None
 
     @property
     def _video_stream(self):
@@ -361,8 +654,16 @@ class PyAVReaderIndexed(FramesSequence):
     def __len__(self):
         return self._len
 
+    def close(self):
+        self._stop_decode_ahead()
+        if self._container is not None:
+            self._container.close()
+            self._container = None
+        super(PyAVReaderIndexed, self).close()
+
     def __del__(self):
-        self._container.close()
+        if getattr(self, '_container', None) is not None:
+            self.close()
 
     @property
     def frame_shape(self):
@@ -372,41 +673,84 @@ class PyAVReaderIndexed(FramesSequence):
     def toc(self):
         return self._toc
 
-    def get_frame(self, j):
-        # Find the packet this frame is in.
-        packet_no = self._toc_cumsum.searchsorted(j, side='right')
-        self._seek_packet(packet_no)
-        # Find the location of the frame within the packet.
-        if packet_no == 0:
-            loc = j
-        else:
-            loc = j - self._toc_cumsum[packet_no - 1]
-        frame = self._current_packet[loc]  # av.VideoFrame
-
-        return Frame(frame.to_ndarray(format='rgb24'), frame_no=j)
+    @property
+    def cache(self):
+        """The cache of decoded frames (see `pims.utils.cache.FrameCache`),
+        which counts cache hits and misses."""
+        return self._cache
 
-    def _seek_packet(self, packet_no):
-        """Advance through the container generator until we get the packet
-        we want. Store that packet in selfpp._current_packet."""
-        packet_ts = self.toc['ts'][packet_no]
-        # Only seek when needed.
-        if packet_no == self._current_packet_no:
-            return
-        elif (packet_no < self._current_packet_no
-                or packet_no > self._current_packet_no + 1):
-            self._container.seek(packet_ts, stream=self._video_stream)
+    def get_frame(self, j):
+        cached_frame = self._cache.get(j)
+        if cached_frame is not None:
+            return cached_frame.to_frame()
 
-        demux = self._container.demux(self._video_stream)
-        self._current_packet = _next_video_packet(demux)
-        while self._current_packet[0].pts < packet_ts:
-            self._current_packet = _next_video_packet(demux)
+        if not self._is_ahead(j):
+            self._seek_frame(j)
+        frame = None
+        while self._next_frame_no <= j:
+            frame = next(self._frames, None)
+            if frame is None:
+                raise IOError("Frame {} could not be decoded".format(j))
+            self._next_frame_no += 1
+
+        frame = WrapPyAvFrame(frame, j, output_format=self._output_format)
+        self._cache.put(j, frame)
+        return frame.to_frame()
+
+    def _is_ahead(self, j):
+        """Whether decoding on from the current position reaches frame j
+        without passing a keyframe at which seeking would start."""
+        if j < self._next_frame_no:
+            return False
+        packet_no = self._toc_cumsum.searchsorted(j, side='right')
+        if self._keyframe_packets is None:
+            current = self._toc_cumsum.searchsorted(self._next_frame_no,
+                                                    side='right')
+            return packet_no <= current + 1
+        start = self._keyframe_start(packet_no)
+        return self._toc_starts[start] <= self._next_frame_no
+
+    def _keyframe_start(self, packet_no):
+        """Return the index of the packet of the last keyframe at or before
+        packet `packet_no`."""
+        if self._keyframe_packets is None:
+            return packet_no
+        k = self._keyframe_packets.searchsorted(packet_no, side='right')
+        return self._keyframe_packets[k - 1] if k > 0 else 0
+
+    def _seek_frame(self, j):
+        """Position the decoder just before frame j.
+
+        The container is seeked to the keyframe preceding frame j, and
+        frames are decoded up to the start of the packet of frame j. If the
+        seek lands too late (the timestamps of frame j are then skipped),
+        the keyframe before is tried, and at last the start of the file.
+        """
+        packet_no = self._toc_cumsum.searchsorted(j, side='right')
+        target_ts = self.toc['ts'][packet_no]
+        start = self._keyframe_start(packet_no)
+        while start > 0:
+            self._stop_decode_ahead()
+            self._container.seek(self.toc['ts'][start],
+                                 stream=self._video_stream)
+            self._start_frames()
+            for frame in self._frames:
+                if frame.pts is None or frame.pts > target_ts:
+                    break  # overshoot
+                if frame.pts == target_ts:
+                    # put the frame back in front of the others
+                    self._frames = itertools.chain([frame], self._frames)
+                    self._next_frame_no = self._toc_starts[packet_no]
+                    return
+            if self._keyframe_packets is None:
+                break
+            start = self._keyframe_start(start - 1)
 
-        self._current_packet_no = packet_no
+        self._load_fresh_file()
 
     @property
     def pixel_type(self):
-        # No need to detect dtype: PyAV always returns uint8.
-        return np.uint8
+        return OUTPUT_FORMATS[self._output_format][1]
 
     def __repr__(self):
         # May be overwritten by subclasses
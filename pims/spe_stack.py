@@ -1,9 +1,11 @@
 import os
 import warnings
+from threading import Lock
 import numpy as np
 
 from .frame import Frame
 from .base_frames import FramesSequence
+from .utils.misc import pread, pread_into
 
 
 class Spec(object):
@@ -110,9 +112,28 @@ class Spec(object):
     no_decode = ["spare4"]
 
 
+def _header_dtype(fields, size):
+    """Build a structured dtype decoding all `fields` (see `Spec.metadata`)
+    from the first `size` bytes of a file at once."""
+    names, formats, offsets = [], [], []
+    for name, sp in fields.items():
+        names.append(name)
+        offsets.append(sp[0])
+        formats.append(sp[1] if len(sp) < 3 else (np.dtype(sp[1]), (sp[2],)))
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets,
+                     "itemsize": size})
+
+
+HEADER_DTYPE = _header_dtype(Spec.metadata, Spec.data_start)
+
+
 class SpeStack(FramesSequence):
     """Read image data from SPE files
 
+    A reader can be shared between threads. Indexing and slicing read one
+    frame at a time, as in other readers; `get_frames` and `as_array` read
+    a block of frames at once.
+
     Attributes
     ----------
     default_char_encoding : string
@@ -130,7 +151,8 @@ class SpeStack(FramesSequence):
     def class_exts(cls):
         return {"spe"} | super(SpeStack, cls).class_exts()
 
-    def __init__(self, filename, char_encoding=None, check_filesize=True):
+    def __init__(self, filename, char_encoding=None, check_filesize=True,
+                 mmap=False):
         """Create an iterable object that returns image data as numpy arrays
 
         Arguments
@@ -147,9 +169,15 @@ class SpeStack(FramesSequence):
             `check_filesize` is `True`, calculate the number of frames from
             the file size. A warning is emitted if this doesn't match the
             number of frames from the file header. Defaults to True.
+        mmap : bool, optional
+            If `True`, memory-map the image data. Frames are then read-only
+            views into the file that are only read from disk when accessed,
+            and `get_frames` returns a view for slices. Defaults to False.
         """
         self._filename = filename
         self._file = open(filename, "rb")
+        self._file_lock = Lock()
+        self._mmap = None
         self._char_encoding = (char_encoding if char_encoding is not None
                                else self.default_char_encoding)
 
@@ -158,10 +186,11 @@ class SpeStack(FramesSequence):
         #Decode each string from the numpy array read by np.fromfile
         decode = np.vectorize(lambda x: x.decode(self._char_encoding))
 
+        header = np.frombuffer(pread(self._file, Spec.data_start, 0,
+                                     self._file_lock), HEADER_DTYPE)
         for name, sp in Spec.metadata.items():
-            self._file.seek(sp[0])
             cnt = (1 if len(sp) < 3 else sp[2])
-            v = np.fromfile(self._file, dtype=sp[1], count=cnt)
+            v = header[name].reshape(-1).copy()
             if v.dtype.kind == "S" and name not in Spec.no_decode:
                 #silently ignore string decoding failures
                 try:
@@ -230,6 +259,9 @@ class SpeStack(FramesSequence):
         else:
             self.metadata.pop("readoutMode", None)
 
+        if mmap:
+            self._mmap = self.as_array()
+
     @property
     def frame_shape(self):
         return self._height, self._width
@@ -238,19 +270,98 @@ class SpeStack(FramesSequence):
         return self._len
 
     def get_frame(self, j):
+        """Read frame `j`. Each frame gets its own (shallow) copy of
+        `metadata`."""
         if j >= self._len:
             raise ValueError("Frame number {} out of range.".format(j))
-        self._file.seek(Spec.data_start
-                        + j*self._width*self._height*self.pixel_type.itemsize)
-        data = np.fromfile(self._file, dtype=self.pixel_type,
-                           count=self._width*self._height)
-        return Frame(data.reshape(self._height, self._width),
-                     frame_no=j, metadata=self.metadata)
+        if self._mmap is not None:
+            data = self._mmap[j]
+        else:
+            data = np.empty((self._height, self._width),
+                            dtype=self.pixel_type)
+            count = pread_into(self._file, data,
+                               Spec.data_start + j * data.nbytes,
+                               self._file_lock)
+            if count < data.nbytes:
+                raise IOError("Frame {} is truncated in the file."
+                              .format(j))
+        return Frame(data, frame_no=j, metadata=self.metadata)
+
+    def get_frames(self, indices):
+        """Read several frames at once into a single array.
+
+        Consecutive frames are stored next to each other in the file and are
+        read with a single call. Unlike `get_frame`, no per-frame metadata is
+        attached.
+
+        Arguments
+        ---------
+        indices : slice or iterable of int
+            Frame numbers to read. Negative numbers count from the end.
+
+        Returns
+        -------
+        frames : ndarray
+            The frames, stacked along the first axis. If the file is
+            memory-mapped and `indices` is a slice, this is a read-only view
+            into the file.
+        """
+        if isinstance(indices, slice):
+            if self._mmap is not None:
+                return self._mmap[indices]
+            start, stop, step = indices.indices(self._len)
+            if step == 1:
+                out = np.empty((max(stop - start, 0), self._height,
+                                self._width), dtype=self.pixel_type)
+                if len(out):
+                    count = pread_into(self._file, out,
+                                       Spec.data_start + start * out[0].nbytes,
+                                       self._file_lock)
+                    if count < out.nbytes:
+                        raise IOError("Frames {} to {} are truncated in the "
+                                      "file.".format(start, stop - 1))
+                return out
+            indices = range(start, stop, step)
+
+        indices = np.asarray(indices, dtype=np.intp).reshape(-1)
+        indices = np.where(indices < 0, indices + self._len, indices)
+        if np.any((indices < 0) | (indices >= self._len)):
+            raise IndexError("Frame number out of range.")
+        if self._mmap is not None:
+            return self._mmap[indices]
+
+        out = np.empty((len(indices), self._height, self._width),
+                       dtype=self.pixel_type)
+        # read each run of consecutive frames with one call
+        breaks = np.flatnonzero(np.diff(indices) != 1) + 1
+        for run in np.split(np.arange(len(indices)), breaks):
+            if len(run):
+                block = out[run[0]:run[-1] + 1]
+                count = pread_into(
+                    self._file, block,
+                    Spec.data_start + indices[run[0]] * out[0].nbytes,
+                    self._file_lock)
+                if count < block.nbytes:
+                    raise IOError("Frames {} to {} are truncated in the "
+                                  "file.".format(indices[run[0]],
+                                                 indices[run[-1]]))
+        return out
+
+    def as_array(self):
+        """Return a read-only (N, height, width) memory map of the image
+        data."""
+        if self._mmap is not None:
+            return self._mmap
+        data = np.memmap(self._filename, dtype=self.pixel_type, mode="r",
+                         offset=Spec.data_start,
+                         shape=(self._len, self._height, self._width))
+        return data.view(np.ndarray)
 
     def close(self):
         """Clean up and close file"""
         super(SpeStack, self).close()
         self._file.close()
+        self._mmap = None
 
     @property
     def pixel_type(self):
@@ -1,8 +1,12 @@
 # Tests for cine.py
 
 import os
+import shutil
+import struct
+import tempfile
 from datetime import datetime
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pims
 import pims.cine
@@ -25,6 +29,48 @@ class _common_cine_sample_tests(object):
         assert self.cin.frame_rate
         assert len(self.cin.frame_shape) == 2
 
+    def test_mmap(self):
+        with pims.Cine(self.sample_filename, mmap=True) as mapped:
+            for i in (0, len(self.cin) - 1, 1):
+                frame = mapped[i]
+                np.testing.assert_equal(frame, self.cin[i])
+                assert frame.frame_no == i
+                assert not frame.flags.writeable
+
+    def test_time_tables(self):
+        times = self.cin.times_to_trigger()
+        exposures = self.cin.exposures()
+        assert times.shape == exposures.shape == (len(self.cin), )
+        assert np.all(np.diff(times) > 0)
+        assert np.all(exposures > 0)
+        assert self.cin.get_time_to_trigger(1) == times[1]
+
+        md = self.cin[1].metadata
+        assert md['exposure'] == exposures[1]
+        assert md['frame_time']['time_to_trigger'] == times[1]
+        ts, frac = self.cin.frame_time_stamps[1]
+        assert md['frame_time']['datetime'] == ts
+        assert isinstance(ts, datetime)
+        assert md['frame_time']['second_fraction'] == frac
+
+    def test_threaded_reads(self):
+        indices = list(range(len(self.cin))) * 4
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            frames = list(executor.map(self.cin.get_frame, indices))
+        for frame, i in zip(frames, indices):
+            np.testing.assert_equal(frame, self.cin.get_frame(i))
+
+    def test_get_frames(self):
+        indices = [2, 0, 1, 1, -1]
+        frames = self.cin.get_frames(indices)
+        assert frames.shape == (len(indices),) + self.cin[0].shape
+        for frame, i in zip(frames, indices):
+            np.testing.assert_equal(frame, self.cin[i])
+
+        out = np.zeros_like(frames)
+        assert self.cin.get_frames(indices, out=out) is out
+        np.testing.assert_equal(out, frames)
+
 
 class test_legacy_cine_sample(_common_cine_sample_tests, unittest.TestCase):
     # File made by Nathan Keim in December 2008, using Phantom Camera Control
@@ -59,3 +105,54 @@ class test_new_cine_sample(_common_cine_sample_tests, unittest.TestCase):
         """Tests based on the specific file in the repo."""
         c = self.cin
         pass
+
+    def test_image_offsets_inside_setup(self):
+        """The image offsets are read from their header offset even if it
+        lies before the end of the setup."""
+        tempdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tempdir, 'long_setup.cine')
+            shutil.copy(self.sample_filename, filename)
+            fields = [name for name, _ in pims.cine.SETUP_FIELDS]
+            length_offset = self.cin.off_setup + pims.cine.fields_size(
+                pims.cine.SETUP_FIELDS[:fields.index('length')])
+            setup_length = self.cin.off_image_offsets - self.cin.off_setup
+            with open(filename, 'r+b') as f:
+                f.seek(length_offset)
+                f.write(struct.pack('<H', setup_length + 100))
+            with pims.Cine(filename) as cin:
+                assert cin.image_locations == self.cin.image_locations
+                np.testing.assert_equal(cin.get_frames([3])[0], self.cin[3])
+        finally:
+            shutil.rmtree(tempdir)
+
+
+class test_packed_data(unittest.TestCase):
+    """Tests for unpacking 10 and 12 bit packed data."""
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.frames = rng.randint(0, 1024, size=(3, 6, 20)).astype('u2')
+
+    def test_ten2sixteen(self):
+        packed = np.array([pims.cine._sixteen2ten(f.ravel())
+                           for f in self.frames])
+        np.testing.assert_equal(pims.cine._ten2sixteen(packed[0]),
+                                self.frames[0].ravel())
+        out = np.empty_like(self.frames)
+        assert pims.cine._ten2sixteen(packed, out) is out
+        np.testing.assert_equal(out, self.frames)
+
+    def test_twelve2sixteen(self):
+        frames = self.frames * 4
+        packed = np.array([pims.cine._sixteen2twelve(f.ravel())
+                           for f in frames])
+        np.testing.assert_equal(pims.cine._twelve2sixteen(packed[0]),
+                                frames[0].ravel())
+        out = np.empty_like(frames)
+        assert pims.cine._twelve2sixteen(packed, out) is out
+        np.testing.assert_equal(out, frames)
+
+    def test_bad_out(self):
+        packed = pims.cine._sixteen2twelve(self.frames.ravel())
+        out = np.empty(2 * self.frames.size, dtype='u2')[::2]
+        self.assertRaises(ValueError, pims.cine._twelve2sixteen, packed, out)
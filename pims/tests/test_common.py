@@ -2,6 +2,8 @@ import gc
 import os
 import random
 import pickle
+import shutil
+import tempfile
 import types
 import unittest
 
@@ -20,6 +22,22 @@ def _skip_if_no_PyAV():
         raise unittest.SkipTest('PyAV not found. Skipping.')
 
 
+def _save_bframe_avi(filename, length=60):
+    """Write an mpeg4 AVI with B-frames, of frames that all differ."""
+    import av
+    with av.open(filename, 'w') as container:
+        stream = container.add_stream('mpeg4', rate=25)
+        stream.width, stream.height, stream.pix_fmt = 64, 48, 'yuv420p'
+        stream.codec_context.max_b_frames = 2
+        stream.codec_context.gop_size = 12
+        for i in range(length):
+            image = np.full((48, 64, 3), (i * 4) % 256, dtype=np.uint8)
+            image[i % 48] = 255
+            frame = av.VideoFrame.from_ndarray(image, format='rgb24')
+            container.mux(stream.encode(frame))
+        container.mux(stream.encode())
+
+
 def _skip_if_no_MoviePy():
     import pims.moviepy_reader
     if not pims.moviepy_reader.available():
@@ -404,7 +422,8 @@ class TestImageReaderND(_image_single, unittest.TestCase):
         clean_dummy_png(path, ['dummy.png'])
 
 
-class TestVideo_PyAV_timed(_image_series, unittest.TestCase):
+class _pyav_image_series(_image_series):
+    """Tests shared by the PyAV readers, which set `klass`."""
     def check_skip(self):
         _skip_if_no_PyAV()
 
@@ -413,27 +432,103 @@ class TestVideo_PyAV_timed(_image_series, unittest.TestCase):
         self.filename = os.path.join(path, 'bulk-water.mov')
         self.frame0 = np.load(os.path.join(path, 'bulk-water_frame0.npy'))
         self.frame1 = np.load(os.path.join(path, 'bulk-water_frame1.npy'))
-        self.klass = pims.PyAVReaderTimed
         self.kwargs = dict()
         self.v = self.klass(self.filename, **self.kwargs)
         self.expected_shape = (424, 640, 3)
         self.expected_len = 480
 
-
-class TestVideo_PyAV_indexed(_image_series, unittest.TestCase):
-    def check_skip(self):
-        _skip_if_no_PyAV()
-
-    def setUp(self):
-        _skip_if_no_PyAV()
-        self.filename = os.path.join(path, 'bulk-water.mov')
-        self.frame0 = np.load(os.path.join(path, 'bulk-water_frame0.npy'))
-        self.frame1 = np.load(os.path.join(path, 'bulk-water_frame1.npy'))
-        self.klass = pims.PyAVReaderIndexed
-        self.kwargs = dict()
-        self.v = self.klass(self.filename, **self.kwargs)
-        self.expected_shape = (424, 640, 3)
-        self.expected_len = 480
+    def test_cache(self):
+        frame_bytes = int(np.prod(self.expected_shape))
+        v = self.klass(self.filename, cache_bytes=4 * frame_bytes)
+        for i in [10, 11, 12, 13, 10, 11]:
+            v[i]
+        assert v.cache.hits == 2
+        assert v.cache.nbytes <= v.cache.max_bytes
+        # frames can be modified without changing the cache
+        frame = v[12]
+        frame[:] = 0
+        assert_equal(v[12], self.v[12])
+
+    def test_decode_ahead(self):
+        v = self.klass(self.filename, thread_type='AUTO', thread_count=2,
+                       decode_ahead=4)
+        for i in [0, 1, 2, 300, 301, 100, 479]:
+            assert_equal(v[i], self.v[i])
+        v.close()
+
+    def test_output_format(self):
+        shape_2D = self.expected_shape[:2]
+        for output_format, shape, dtype in [('gray', shape_2D, np.uint8),
+                                            ('gray16', shape_2D, np.uint16),
+                                            ('y', shape_2D, np.uint8),
+                                            ('yuv', (3,) + shape_2D, np.uint8)]:
+            v = self.klass(self.filename, output_format=output_format)
+            frame = v[10]
+            assert frame.shape == v.frame_shape == shape
+            assert frame.dtype == v.pixel_type == dtype
+        # the luma plane is read as is
+        assert_equal(self.klass(self.filename, output_format='y')[10],
+                     self.klass(self.filename, output_format='yuv')[10][0])
+        self.assertRaises(ValueError, self.klass, self.filename,
+                          output_format='bgr')
+
+
+class TestVideo_PyAV_timed(_pyav_image_series, unittest.TestCase):
+    klass = pims.PyAVReaderTimed
+
+    def test_keyframe_seek(self):
+        indexed = pims.PyAVReaderIndexed(self.filename)
+        for i in [300, 5, 479, 240, 241, 290, 100]:
+            assert_equal(self.v[i], indexed[i])
+        keyframes = np.flatnonzero(indexed.toc['keyframes'])
+        assert_equal(self.v._keyframes[1], keyframes)
+
+    def test_bframes_random_access(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tempdir, 'bframes.avi')
+            _save_bframe_avi(filename)
+            expected = [np.array(frame) for frame in self.klass(filename)]
+            order = list(range(len(expected)))
+            random.Random(0).shuffle(order)
+            v = self.klass(filename)
+            # the first keyframe seeked to lies after the first frames
+            for i in [30, 0, 1, 2] + order:
+                assert_equal(v[i], expected[i])
+            v.close()
+        finally:
+            shutil.rmtree(tempdir)
+
+
+class TestVideo_PyAV_indexed(_pyav_image_series, unittest.TestCase):
+    klass = pims.PyAVReaderIndexed
+
+    def test_decoded_toc(self):
+        # the toc from packet timestamps gives the frames found by decoding
+        with pims.pyav_reader.av.open(self.filename) as container:
+            toc = pims.pyav_reader._toc_from_frames(
+                container, container.streams.video[0])
+        assert sum(toc['lengths']) == self.expected_len
+        v = self.klass(self.filename, toc=toc)
+        for i in [300, 5, 479, 240]:
+            assert_equal(v[i], self.v[i])
+
+    def test_toc_without_keyframes(self):
+        toc = dict(lengths=self.v.toc['lengths'], ts=self.v.toc['ts'])
+        v = self.klass(self.filename, toc=toc)
+        for i in [300, 5, 479, 240]:
+            assert_equal(v[i], self.v[i])
+
+    def test_cache_toc(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tempdir, 'video.mov')
+            shutil.copy(self.filename, filename)
+            v = self.klass(filename, cache_toc=True)
+            assert os.path.exists(pims.utils.sidecar.sidecar_path(filename))
+            assert self.klass(filename, cache_toc=True).toc == v.toc
+        finally:
+            shutil.rmtree(tempdir)
 
 
 class TestVideo_ImageIO(_image_series, unittest.TestCase):
@@ -507,6 +602,32 @@ class TestTiffStack_pil(_tiff_image_series, unittest.TestCase):
         self.expected_shape = (512, 512)
         self.expected_len = 5
 
+    def test_random_access(self):
+        frames = [np.array(frame) for frame in self.v]
+        for i in [4, 0, 3, 3, 1]:
+            assert_equal(self.v[i], frames[i])
+
+
+class _TiffStack_pil_public(pims.TiffStack_pil):
+    """Seek through the frames with the public Pillow API only."""
+    def _can_index_frames(self):
+        return False
+
+
+class TestTiffStack_pil_public(TestTiffStack_pil):
+    def setUp(self):
+        super(TestTiffStack_pil_public, self).setUp()
+        self.v.close()
+        self.klass = _TiffStack_pil_public
+        self.v = self.klass(self.filename, **self.kwargs)
+
+    def test_same_frames(self):
+        indexed = pims.TiffStack_pil(self.filename)
+        assert len(self.v) == len(indexed)
+        for i in [3, 0, 4]:
+            assert_equal(self.v[i], indexed[i])
+        indexed.close()
+
 
 class TestTiffStack_tifffile(_tiff_image_series, unittest.TestCase):
     def check_skip(self):
@@ -525,6 +646,8 @@ class TestTiffStack_tifffile(_tiff_image_series, unittest.TestCase):
 
 
 class TestSpeStack(_image_series, unittest.TestCase):
+    kwargs = dict()
+
     def check_skip(self):
         pass
 
@@ -533,7 +656,6 @@ class TestSpeStack(_image_series, unittest.TestCase):
         self.frame0 = np.load(os.path.join(path, 'spestack_test_frame0.npy'))
         self.frame1 = np.load(os.path.join(path, 'spestack_test_frame1.npy'))
         self.klass = pims.SpeStack
-        self.kwargs = dict()
         self.v = self.klass(self.filename, **self.kwargs)
         self.expected_shape = (128, 128)
         self.expected_len = 5
@@ -547,6 +669,43 @@ class TestSpeStack(_image_series, unittest.TestCase):
 
         assert_equal(m, d)
 
+    def test_get_frames(self):
+        expected = np.array([self.v.get_frame(i) for i in range(len(self.v))])
+        assert_equal(self.v.get_frames(slice(1, 4)), expected[1:4])
+        assert_equal(self.v.get_frames(slice(None, None, -2)), expected[::-2])
+        assert_equal(self.v.get_frames([4, 0, 1, 2, -1]),
+                     expected[[4, 0, 1, 2, -1]])
+        assert_equal(self.v.as_array(), expected)
+        self.assertRaises(IndexError, self.v.get_frames, [5])
+
+    def test_truncated(self):
+        if self.kwargs.get('mmap'):
+            raise unittest.SkipTest('Truncated files cannot be mapped.')
+        tempdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tempdir, 'truncated.spe')
+            shutil.copy(self.filename, filename)
+            with open(filename, 'r+b') as f:
+                f.truncate(os.path.getsize(filename) - 100)
+            v = self.klass(filename, check_filesize=False)
+            assert_equal(v.get_frame(3), self.v.get_frame(3))
+            self.assertRaises(IOError, v.get_frame, 4)
+            self.assertRaises(IOError, v.get_frames, range(5))
+            self.assertRaises(IOError, v.get_frames, [0, 2, 4])
+            self.assertRaises(IOError, v.get_frames, slice(None))
+            v.close()
+        finally:
+            shutil.rmtree(tempdir)
+
+
+class TestSpeStackMmap(TestSpeStack):
+    kwargs = dict(mmap=True)
+
+    def test_views(self):
+        frames = self.v.get_frames(slice(1, 4))
+        assert np.shares_memory(frames, self.v.as_array())
+        assert not self.v[0].flags.writeable
+
 
 class TestOpenFiles(unittest.TestCase):
     def test_open_png(self):
@@ -1,4 +1,5 @@
 import os
+import shutil
 import tempfile
 import zipfile
 import unittest
@@ -99,6 +100,125 @@ class TestImageSequenceAcceptsList(_image_series, unittest.TestCase):
         clean_dummy_png(self.filepath, self.filenames)
 
 
+class TestImageSequencePrefetch(_image_series, unittest.TestCase):
+    def setUp(self):
+        self.filepath = os.path.join(path, 'image_sequence')
+        self.filenames = ['T76S3F00001.png', 'T76S3F00002.png',
+                          'T76S3F00003.png', 'T76S3F00004.png',
+                          'T76S3F00005.png']
+        shape = (10, 11)
+        self.frames = save_dummy_png(self.filepath, self.filenames, shape)
+
+        self.filename = os.path.join(self.filepath, '*.png')
+        self.frame0 = self.frames[0]
+        self.frame1 = self.frames[1]
+        self.kwargs = dict(prefetch=2)
+        self.klass = pims.ImageSequence
+        self.v = self.klass(self.filename, **self.kwargs)
+        self.expected_shape = shape
+        self.expected_len = 5
+
+    def test_random_access(self):
+        for i in [0, 1, 2, 4, 1, 3, 3, 0]:
+            assert_equal(self.v[i], self.frames[i])
+        # only frames following the last one are kept
+        assert sorted(self.v._prefetcher._pending) == [1, 2]
+
+    def test_close(self):
+        self.v.close()
+        self.assertRaises(ValueError, self.v.get_frame, 0)
+
+    def tearDown(self):
+        self.v.close()
+        clean_dummy_png(self.filepath, self.filenames)
+
+
+class TestImageSequenceListing(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.tempdir, 'images')
+        os.mkdir(self.filepath)
+        self.filenames = ['img_2.png', 'img_10.png', 'img_1.png', '.img_3.png']
+        save_dummy_png(self.filepath, self.filenames, (10, 11))
+        self.filename = os.path.join(self.filepath, '*.png')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_glob(self):
+        # hidden files are skipped, like glob does
+        v = pims.ImageSequence(self.filename)
+        assert v._filepaths == [os.path.join(self.filepath, fn) for fn in
+                                ['img_1.png', 'img_2.png', 'img_10.png']]
+
+    def test_cache_index(self):
+        v = pims.ImageSequence(self.filename, cache_index=True)
+        cache = pims.utils.sidecar.sidecar_path(self.filepath, 'listing')
+        assert os.path.exists(cache)
+        assert pims.ImageSequence(self.filename,
+                                  cache_index=True)._filepaths == v._filepaths
+        # another pattern in the same directory is listed again
+        v = pims.ImageSequence(os.path.join(self.filepath, 'img_1*.png'),
+                               cache_index=True)
+        assert len(v) == 2
+        # as is a changed directory
+        save_dummy_png(self.filepath, ['img_3.png'], (10, 11))
+        os.utime(self.filepath, ns=(0, 0))
+        v = pims.ImageSequence(self.filename, cache_index=True)
+        assert len(v) == 4
+
+    def test_cache_index_shared_directory(self):
+        # other readers that cache a listing of the same directory keep
+        # their own sidecar
+        from PIL import Image
+        for i in (1, 2):
+            Image.fromarray(np.zeros((10, 11), np.uint8)).save(
+                os.path.join(self.filepath, 'img_{}.tif'.format(i)))
+        template = os.path.join(self.filepath, 'img_{ind}.tif')
+        v = pims.ImageSequence(self.filename, cache_index=True)
+        series = pims.tiff_stack.TiffSeries(template, offset=1,
+                                            cache_listing=True)
+        assert len(series) == 2
+        assert pims.ImageSequence(self.filename,
+                                  cache_index=True)._filepaths == v._filepaths
+        assert len(pims.tiff_stack.TiffSeries(template, offset=1,
+                                              cache_listing=True)) == 2
+
+
+class TestImageSequenceProbing(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.filenames = ['img_1.png', 'img_2.png']
+        self.frames = save_dummy_png(self.tempdir, self.filenames, (10, 11))
+        # the image data is not decoded when opening
+        filename = os.path.join(self.tempdir, 'img_1.png')
+        with open(filename, 'rb') as f:
+            data = f.read()
+        with open(filename, 'wb') as f:
+            f.write(data[:data.index(b'IDAT') + 4])
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_image_sequence(self):
+        v = pims.ImageSequence(os.path.join(self.tempdir, '*.png'))
+        assert v.frame_shape == (10, 11)
+        assert v.pixel_type == np.uint8
+        assert_equal(v[1], self.frames[1])
+
+    def test_reader_sequence(self):
+        v = pims.ReaderSequence(os.path.join(self.tempdir, '*.png'),
+                                pims.ImageReaderND)
+        assert v.sizes == dict(t=2, y=10, x=11)
+        assert_equal(v[1], self.frames[1])
+
+    def test_lazy_reader(self):
+        filename = os.path.join(self.tempdir, 'img_1.png')
+        v = pims.ImageReader(filename, lazy=True)
+        assert v.frame_shape == (10, 11)
+        assert v.pixel_type == np.uint8
+
+
 class TestImageSequenceNaturalSorting(_image_series, unittest.TestCase):
     def setUp(self):
         _skip_if_no_skimage()
@@ -203,6 +323,27 @@ class ImageSequenceND(_image_series, unittest.TestCase):
         assert_equal(self.v.sizes['c'], self.expected_C)
 
 
+class TestImageSequenceNDMissingAxis(unittest.TestCase):
+    def setUp(self):
+        # the directory name must not contain axis indices
+        self.filepath = os.path.join(path, 'image_sequence_tc')
+        # no z index: the axes after it are still found
+        self.filenames = ['file_t{}_c{}.png'.format(t, c)
+                          for t in range(1, 4) for c in range(2)]
+        self.frames = save_dummy_png(self.filepath, self.filenames, (10, 11))
+
+    def tearDown(self):
+        clean_dummy_png(self.filepath, self.filenames)
+
+    def test_lookup(self):
+        v = pims.ImageSequenceND(os.path.join(self.filepath, '*.png'))
+        assert v.sizes == dict(t=3, c=2, y=10, x=11)
+        v.bundle_axes = 'yx'
+        v.iter_axes = 'tc'
+        for i in [5, 0, 3]:
+            assert_equal(v[i], self.frames[i])
+
+
 class ImageSequenceND_RGB(_image_series, unittest.TestCase):
     def setUp(self):
         self.filepath = os.path.join(path, 'image_sequence3d')
@@ -265,5 +406,33 @@ class ReaderSequence(_image_series, unittest.TestCase):
         self.check_skip()
         assert_equal(self.v.sizes['c'], self.expected_C)
 
+    def test_reader_pool(self):
+        opened = []
+
+        class Reader(pims.ImageReaderND):
+            def __init__(self, filename, **kwargs):
+                super(Reader, self).__init__(filename, **kwargs)
+                self.closed = False
+                opened.append(self)
+
+            def close(self):
+                self.closed = True
+
+        v = self.klass(self.filename, reader_cls=Reader, pool_size=2)
+        del opened[:]
+        v.iter_axes = 'tc'
+        for i in range(6):  # files 0 and 1, channel by channel
+            v[i]
+        assert len(opened) == 2
+        v.bundle_axes = 'yxc'
+        v.iter_axes = 't'
+        assert_equal(v[1], self.frame1)
+        assert len(opened) == 2
+        v[2]
+        # the least recently used reader is closed
+        assert [r.closed for r in opened] == [True, False, False]
+        v.close()
+        assert all(r.closed for r in opened)
+
     def tearDown(self):
         clean_dummy_png(self.filepath, self.filenames)
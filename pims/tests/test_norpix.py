@@ -1,14 +1,42 @@
 # Tests for norpix_reader.py
 
 import os
+import io
+import shutil
+import struct
+import tempfile
 from datetime import datetime
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pims
 import pims.norpix_reader
 
 tests_path, _ = os.path.split(os.path.abspath(__file__))
 
+
+def _write_compressed_seq(filename, images, times, padding=0):
+    """Write a minimal StreamPix 6 sequence of PNG-compressed frames."""
+    from PIL import Image
+    values = dict(magic=0xFEED, name=b'Norpix seq', version=5,
+                  header_size=1024, width=images.shape[2],
+                  height=images.shape[1], bit_depth=8, bit_depth_real=8,
+                  image_format=1, allocated_frames=len(images),
+                  compression_format=1)
+    fmt = '<' + ''.join(f for _, f in pims.norpix_reader.HEADER_FIELDS)
+    header = struct.pack(fmt, *[values.get(k, b'' if f.endswith('s') else 0)
+                                for k, f in pims.norpix_reader.HEADER_FIELDS])
+    with open(filename, 'wb') as f:
+        f.write(header.ljust(8192, b'\0'))
+        for image, t in zip(images, times):
+            buf = io.BytesIO()
+            Image.fromarray(image).save(buf, format='png')
+            data = buf.getvalue()
+            f.write(struct.pack('<L', len(data) + 4) + data)
+            f.write(struct.pack('<LHH', int(t), int(t * 1000) % 1000, 0))
+            f.write(b'\0' * padding)
+
+
 class _common_norpix_sample_tests(object):
     """Test the Norpix .seq reader on a sample file."""
     def setUp(self):
@@ -49,6 +77,13 @@ class _common_norpix_sample_tests(object):
             assert fr.shape[1] == s.width
             assert fr.shape[0] == s.height
 
+    def test_threaded_reads(self):
+        indices = list(range(len(self.seq))) * 4
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            frames = list(executor.map(self.seq.get_frame, indices))
+        for frame, i in zip(frames, indices):
+            np.testing.assert_equal(frame, self.seq.get_frame(i))
+
     def test_get_time(self):
         """Check all 3 ways to get time of a frame."""
         s = self.seq
@@ -73,7 +108,17 @@ class _common_norpix_sample_tests(object):
         assert s.get_time_float(4) == list(sli.get_time_float[:])[0]
 
     def test_dump_times(self):
-        assert isinstance(self.seq.dump_times_float(), np.ndarray)
+        times = self.seq.dump_times_float()
+        assert isinstance(times, np.ndarray)
+        np.testing.assert_equal(times, [self.seq.get_time_float(i)
+                                        for i in range(len(self.seq))])
+
+    def test_as_array(self):
+        arr = self.seq.as_array()
+        assert arr.shape == (len(self.seq), ) + self.seq[0].shape
+        assert arr.dtype == self.seq.pixel_type
+        for i in range(len(self.seq)):
+            np.testing.assert_equal(arr[i], self.seq[i])
 
     def test_repr(self):
         assert len(repr(self.seq))
@@ -114,6 +159,22 @@ class test_defaults(_norpix6_sample_tests, unittest.TestCase):
         """Based on the specific file in the repo."""
         assert self.seq[0].dtype == np.uint8
 
+    def test_truncated(self):
+        """A file cut short while open raises instead of returning garbage."""
+        tempdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tempdir, 'truncated.seq')
+            shutil.copy(self.sample_filename, filename)
+            with pims.open(filename) as seq:
+                with open(filename, 'r+b') as f:
+                    # within the pixels of the last frame
+                    f.truncate(seq._image_offset +
+                               seq._image_block_size * (len(seq) - 1) + 100)
+                seq[0]
+                self.assertRaises(IOError, seq.get_frame, len(seq) - 1)
+        finally:
+            shutil.rmtree(tempdir)
+
 
 # class test_dtype(_norpix6_sample_tests, unittest.TestCase):
 #     def setUp(self):
@@ -139,6 +200,67 @@ class test_defaults(_norpix6_sample_tests, unittest.TestCase):
 #         assert np.all(fr <= 0)
 
 
+class test_compressed(unittest.TestCase):
+    def setUp(self):
+        try:
+            import PIL
+        except ImportError:
+            raise unittest.SkipTest('Pillow not installed. Skipping.')
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, 'compressed.seq')
+        rng = np.random.RandomState(0)
+        self.images = rng.randint(0, 256, (7, 12, 16)).astype(np.uint8)
+        self.times = 1500000000 + np.arange(7) * 0.25
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def check(self, seq):
+        assert len(seq) == len(self.images)
+        assert seq.frame_shape == self.images.shape[1:]
+        assert seq.pixel_type == np.uint8
+        for i, image in enumerate(self.images):
+            np.testing.assert_equal(seq[i], image)
+            assert seq[i].metadata['time_float'] == self.times[i]
+        np.testing.assert_equal(seq.dump_times_float(), self.times)
+        np.testing.assert_equal(seq.get_frames([6, 0, -2], max_workers=2),
+                                self.images[[6, 0, -2]])
+
+    def test_walk(self):
+        _write_compressed_seq(self.filename, self.images, self.times)
+        with pims.NorpixSeq(self.filename) as seq:
+            self.check(seq)
+        assert not os.path.exists(self.filename + '.pims.npz')
+
+    def test_padded_records(self):
+        _write_compressed_seq(self.filename, self.images, self.times,
+                              padding=8)
+        with pims.NorpixSeq(self.filename) as seq:
+            self.check(seq)
+
+    def test_cached_index(self):
+        _write_compressed_seq(self.filename, self.images, self.times)
+        with pims.NorpixSeq(self.filename, cache_index=True) as seq:
+            self.check(seq)
+        assert os.path.exists(self.filename + '.pims.npz')
+        with pims.NorpixSeq(self.filename, cache_index=True) as seq:
+            self.check(seq)
+
+    def test_idx_file(self):
+        _write_compressed_seq(self.filename, self.images, self.times)
+        with pims.NorpixSeq(self.filename) as seq:
+            offsets, sizes = seq._frame_offsets, seq._frame_sizes
+        idx = np.zeros(len(offsets), dtype=[('offset', '<u8'),
+                                            ('size', '<u4'),
+                                            ('unused', 'V12')])
+        idx['offset'] = offsets
+        idx['size'] = sizes
+        idx.tofile(self.filename + '.idx')
+        with pims.NorpixSeq(self.filename) as seq:
+            assert seq._read_idx_file() is not None
+            self.check(seq)
+
+
 class test_as_raw(_norpix6_sample_tests, unittest.TestCase):
     def setUp(self):
         self.options = {'as_raw': True}
@@ -0,0 +1,263 @@
+# Tests for the tifffile based TIFF reader, on stacks written by tifffile
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from numpy.testing import assert_equal
+
+import pims
+
+try:
+    import tifffile
+except ImportError:
+    tifffile = None
+
+
+class _tifffile_stack_tests(object):
+    write_kwargs = dict()
+    write_shape = (6, 20, 30)
+
+    def setUp(self):
+        if tifffile is None:
+            raise unittest.SkipTest('tifffile not installed. Skipping.')
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, 'stack.tif')
+        rng = np.random.RandomState(0)
+        self.data = rng.randint(0, 2**16, (6, 20, 30)).astype(np.uint16)
+        tifffile.imwrite(self.filename, self.data.reshape(self.write_shape),
+                         **self.write_kwargs)
+        self.v = pims.TiffStack_tifffile(self.filename)
+
+    def tearDown(self):
+        self.v.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_get_frame(self):
+        assert len(self.v) == len(self.data)
+        for i in [5, 0, 2]:
+            frame = self.v[i]
+            assert frame.dtype == self.data.dtype
+            assert_equal(frame, self.data[i])
+
+    def test_region(self):
+        for region in [(0, 20, 0, 30), (3, 17, 11, 12), (19, 20, 5, 30)]:
+            y0, y1, x0, x1 = region
+            frame = self.v.get_frame(4, region=region)
+            assert frame.frame_no == 4
+            assert frame.dtype.isnative
+            assert_equal(frame, self.data[4, y0:y1, x0:x1])
+        self.assertRaises(ValueError, self.v.get_frame, 0, region=(0, 21, 0, 5))
+        self.assertRaises(ValueError, self.v.get_frame, 0, region=(5, 5, 0, 5))
+
+    def test_get_frames(self):
+        indices = [5, 0, 2, 2, -1]
+        frames = self.v.get_frames(indices, max_workers=3)
+        assert frames.dtype.isnative
+        assert_equal(frames, self.data[indices])
+        self.assertRaises(IndexError, self.v.get_frames, [6])
+
+    def test_iter_frames(self):
+        frames = list(self.v.iter_frames(max_workers=2))
+        assert [frame.frame_no for frame in frames] == list(range(6))
+        assert_equal(np.array(frames), self.data)
+        frames = self.v.iter_frames([3, 1], max_workers=2)
+        assert_equal(next(frames), self.data[3])
+        frames.close()
+
+
+class TestMetadata(unittest.TestCase):
+    def setUp(self):
+        if tifffile is None:
+            raise unittest.SkipTest('tifffile not installed. Skipping.')
+        self.filename = os.path.join(os.path.dirname(__file__), 'data',
+                                     'stuck.tif')
+
+    def test_full(self):
+        with pims.TiffStack_tifffile(self.filename) as v:
+            expected = v[0].metadata
+            assert 'DateTime' in expected
+            v[1].metadata.clear()
+            assert v[1].metadata == expected
+            assert v.get_metadata(1) == expected
+
+    def test_lazy(self):
+        with pims.TiffStack_tifffile(self.filename) as v:
+            expected = v[0].metadata
+        with pims.TiffStack_tifffile(self.filename, metadata='lazy') as v:
+            assert v[0].metadata == {}
+            assert v.get_metadata(0) == expected
+
+    def test_none(self):
+        with pims.TiffStack_tifffile(self.filename, metadata='none') as v:
+            assert v[0].metadata == {}
+            assert v.get_metadata(0) == {}
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, pims.TiffStack_tifffile, self.filename,
+                          metadata='all')
+
+
+class TestContiguous(_tifffile_stack_tests, unittest.TestCase):
+    def test_as_array(self):
+        stack = self.v.as_array()
+        assert_equal(stack, self.data)
+        assert np.shares_memory(stack[1:4], stack)
+        assert_equal(stack[[4, 0, 4]], self.data[[4, 0, 4]])
+        assert not stack.flags.writeable
+
+    def test_frames_are_copies(self):
+        frame = self.v[1]
+        frame[:] = 0
+        assert_equal(self.v[1], self.data[1])
+
+    def test_mmap(self):
+        with pims.TiffStack_tifffile(self.filename, mmap=True) as v:
+            assert not v[1].flags.writeable
+            assert_equal(v[1], self.data[1])
+
+
+class TestContiguousBigEndian(TestContiguous):
+    write_kwargs = dict(byteorder='>')
+
+    def test_mmap(self):
+        # frames are converted to native byte order
+        with pims.TiffStack_tifffile(self.filename, mmap=True) as v:
+            assert v[1].dtype.isnative
+            assert_equal(v[1], self.data[1])
+
+
+class TestImageJHyperstack(TestContiguous):
+    write_kwargs = dict(imagej=True, metadata=dict(axes='TZYX'))
+    write_shape = (3, 2, 20, 30)
+
+
+class TestCompressed(_tifffile_stack_tests, unittest.TestCase):
+    write_kwargs = dict(compression='zlib', rowsperstrip=3)
+
+    def test_as_array(self):
+        self.assertRaises(ValueError, self.v.as_array)
+
+
+class TestTiled(_tifffile_stack_tests, unittest.TestCase):
+    write_kwargs = dict(compression='zlib', tile=(16, 16))
+
+
+class TestSparseTiles(unittest.TestCase):
+    def setUp(self):
+        if tifffile is None:
+            raise unittest.SkipTest('tifffile not installed. Skipping.')
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, 'sparse.tif')
+        self.data = np.arange(3 * 40 * 64, dtype=np.uint16).reshape(3, 40, 64)
+        tifffile.imwrite(self.filename, self.data, tile=(16, 16),
+                         compression='zlib', photometric='minisblack')
+        # leave out the second tile of every page
+        with tifffile.TiffFile(self.filename, mode='r+') as tif:
+            for page in tif.pages:
+                for name in ('TileOffsets', 'TileByteCounts'):
+                    values = list(page.tags[name].value)
+                    values[1] = 0
+                    page.tags[name].overwrite(values)
+        self.data[:, :16, 16:32] = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_region(self):
+        with pims.TiffStack_tifffile(self.filename) as v:
+            assert_equal(v[1], self.data[1])
+            assert_equal(v.get_frame(1, region=(5, 20, 10, 40)),
+                         self.data[1, 5:20, 10:40])
+            assert_equal(v.get_frame(2, region=(0, 16, 16, 32)),
+                         self.data[2, :16, 16:32])
+
+
+class TestPyramid(unittest.TestCase):
+    def setUp(self):
+        if tifffile is None:
+            raise unittest.SkipTest('tifffile not installed. Skipping.')
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, 'pyramid.tif')
+        rng = np.random.RandomState(0)
+        self.data = rng.randint(0, 2**16, (3, 40, 64)).astype(np.uint16)
+        with tifffile.TiffWriter(self.filename) as tif:
+            tif.write(self.data, subifds=1, tile=(16, 16),
+                      photometric='minisblack')
+            tif.write(self.data[:, ::2, ::2], subfiletype=1, tile=(16, 16),
+                      photometric='minisblack')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_levels(self):
+        with pims.TiffStack_tifffile(self.filename) as v:
+            assert v.frame_shape == (40, 64)
+            assert_equal(v[2], self.data[2])
+        with pims.TiffStack_tifffile(self.filename, level=1) as v:
+            assert len(v) == 3
+            assert v.frame_shape == (20, 32)
+            assert_equal(v[2], self.data[2, ::2, ::2])
+            assert_equal(v.get_frame(1, region=(5, 20, 10, 17)),
+                         self.data[1, ::2, ::2][5:20, 10:17])
+        self.assertRaises(ValueError, pims.TiffStack_tifffile, self.filename,
+                          level=2)
+
+
+class TestTiffSeries(unittest.TestCase):
+    def setUp(self):
+        if tifffile is None:
+            raise unittest.SkipTest('tifffile not installed. Skipping.')
+        if not pims.tiff_stack.PIL_available():
+            raise unittest.SkipTest('PIL/Pillow not installed. Skipping.')
+        self.tempdir = tempfile.mkdtemp()
+        self.directory = os.path.join(self.tempdir, 'series')
+        os.mkdir(self.directory)
+        self.template = os.path.join(self.directory, 'f_{ind:03d}.tif')
+        self.data = np.arange(4 * 5 * 6, dtype=np.uint16).reshape(4, 5, 6)
+        for i, image in enumerate(self.data):
+            tifffile.imwrite(self.template.format(ind=i + 1), image)
+        # gaps and badly padded names end the series
+        tifffile.imwrite(self.template.format(ind=7), self.data[0])
+        tifffile.imwrite(os.path.join(self.directory, 'f_05.tif'),
+                         self.data[0])
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_frames(self):
+        v = pims.tiff_stack.TiffSeries(self.template)
+        assert len(v) == 4
+        assert v.frame_shape == (5, 6)
+        for i in [3, 0]:
+            assert v[i].dtype == np.uint16
+            assert_equal(v[i], self.data[i])
+        assert len(pims.tiff_stack.TiffSeries(self.template, offset=2)) == 3
+
+    def test_cache_listing(self):
+        v = pims.tiff_stack.TiffSeries(self.template, cache_listing=True)
+        assert len(v) == 4
+        cache = pims.utils.sidecar.sidecar_path(self.directory)
+        assert os.path.exists(cache)
+        assert len(pims.tiff_stack.TiffSeries(self.template,
+                                              cache_listing=True)) == 4
+        # a changed directory is listed again
+        tifffile.imwrite(self.template.format(ind=5), self.data[0])
+        tifffile.imwrite(self.template.format(ind=6), self.data[0])
+        os.utime(self.directory, ns=(0, 0))
+        assert len(pims.tiff_stack.TiffSeries(self.template,
+                                              cache_listing=True)) == 7
+
+    def test_foreign_sidecar(self):
+        # a sidecar written by another reader is listed again
+        cache = pims.utils.sidecar.sidecar_path(self.directory)
+        pims.utils.sidecar.save_sidecar(cache, self.directory,
+                                        filepaths=np.array(['f_001.tif']))
+        assert len(pims.tiff_stack.TiffSeries(self.template,
+                                              cache_listing=True)) == 4
+
+
+if __name__ == '__main__':
+    unittest.main()
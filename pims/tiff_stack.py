@@ -1,11 +1,17 @@
+import itertools
 import os
+import re
+import string
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import itertools
 import warnings
 
 import numpy as np
 
 from pims.frame import Frame
+from pims.utils.sidecar import sidecar_path, load_sidecar, save_sidecar
 
 try:
     from PIL import Image  # should work with PIL or PILLOW
@@ -73,6 +79,42 @@ def _tiff_datetime(dt_str):
         f"Cannot parse {dt_str} with any of the supported formats")
 
 
+def _tiff_ifd_offsets(fh):
+    """Return the offsets of all image file directories (IFDs) of a TIFF
+    file, by following the chain of IFDs without decoding any tags."""
+    fh.seek(0)
+    header = fh.read(16)
+    byteorder = {b'II': '<', b'MM': '>'}.get(header[:2])
+    if byteorder is None:
+        raise ValueError("Not a TIFF file")
+    version, = struct.unpack(byteorder + 'H', header[2:4])
+    if version == 43:  # BigTIFF
+        count_fmt, entry_size, offset_fmt = 'Q', 20, 'Q'
+        offset, = struct.unpack(byteorder + 'Q', header[8:16])
+    else:
+        count_fmt, entry_size, offset_fmt = 'H', 12, 'I'
+        offset, = struct.unpack(byteorder + 'I', header[4:8])
+    count_struct = struct.Struct(byteorder + count_fmt)
+    offset_struct = struct.Struct(byteorder + offset_fmt)
+
+    offsets = []
+    seen = set()
+    while offset and offset not in seen:
+        fh.seek(offset)
+        data = fh.read(count_struct.size)
+        if len(data) < count_struct.size:
+            break
+        offsets.append(offset)
+        seen.add(offset)
+        count, = count_struct.unpack(data)
+        fh.seek(offset + count_struct.size + count * entry_size)
+        data = fh.read(offset_struct.size)
+        if len(data) < offset_struct.size:
+            break
+        offset, = offset_struct.unpack(data)
+    return offsets
+
+
 class TiffStack_tifffile(FramesSequence):
     """Read TIFF stacks (single files containing many images) into an
     iterable object that returns images as numpy arrays.
@@ -80,9 +122,27 @@ class TiffStack_tifffile(FramesSequence):
     This reader, based on tiffile.py, should read standard TIFF
     files and sundry derivatives of the format used in microscopy.
 
+    When the image data of the file is stored uncompressed in one
+    contiguous block (as in ImageJ hyperstacks), it is memory-mapped:
+    frames are then copied from the memory map instead of being decoded
+    page by page, and `as_array` gives all frames at once.
+
     Parameters
     ----------
     filename : string
+    mmap : boolean, optional
+        If True, frames of memory-mapped files are returned as read-only
+        views into the file instead of copies. Default False.
+    level : int, optional
+        Pyramid level to read from pyramidal files (such as whole-slide
+        images): 0, the default, is full resolution, and higher levels are
+        downsampled.
+    metadata : {'full', 'lazy', 'none'}, optional
+        With 'full' (default), every frame carries the metadata read from
+        the tags of its page. With 'lazy', frames carry no metadata, and it
+        is only read when asked for with `get_metadata`. With 'none', tags
+        are never read. In all cases, the tags of pages that share a
+        keyframe are only parsed once.
 
     Examples
     --------
@@ -103,6 +163,16 @@ class TiffStack_tifffile(FramesSequence):
     >>> frame_count = len(video) # Number of frames in video
     >>> frame_shape = video.frame_shape # Pixel dimensions of video
 
+    >>> stack = video.as_array()  # all frames, if the data is contiguous
+    >>> stack[100:5000]  # a view; nothing is read until pixels are used
+
+    >>> # Decode only the tiles or strips covering a window of frame 0
+    >>> window = video.get_frame(0, region=(1000, 1512, 2000, 2512))
+
+    >>> frames = video.get_frames(range(100), max_workers=8)
+    >>> for frame in video.iter_frames(max_workers=8):
+    ...    # Frames are decoded ahead, in parallel.
+
     Note
     ----
     This wraps tifffile.py. It should deal with a range of
@@ -123,9 +193,18 @@ class TiffStack_tifffile(FramesSequence):
         return {'tif', 'tiff', 'lsm',
                 'stk'} | super(TiffStack_tifffile, cls).class_exts()
 
-    def __init__(self, filename):
+    def __init__(self, filename, mmap=False, metadata='full', level=0):
+        if metadata not in ('full', 'lazy', 'none'):
+            raise ValueError("metadata should be 'full', 'lazy' or 'none'")
         self._filename = filename
         record = tifffile.TiffFile(filename).series[0]
+        if level:
+            levels = getattr(record, 'levels', [record])
+            if not 0 <= level < len(levels):
+                record.parent.close()
+                raise ValueError("{} has {} pyramid level(s)".format(
+                    filename, len(levels)))
+            record = levels[level]
         if hasattr(record, 'pages'):
             self._tiff = record.pages
         else:
@@ -134,11 +213,232 @@ class TiffStack_tifffile(FramesSequence):
         tmp = self._tiff[0]
         self._dtype = tmp.dtype
         self._im_sz = tmp.shape
-
-    def get_frame(self, j):
-        t = self._tiff[j]
-        data = t.asarray()
-        return Frame(data, frame_no=j, metadata=self._read_metadata(t))
+        self._count = len(self._tiff)
+        self._tiff_file = record.parent
+        self._mmap = mmap
+        self._metadata_mode = metadata
+        self._metadata_cache = {}
+        self._memmap = self._map_series(record)
+
+    def _map_series(self, record):
+        """Memory-map the image data of the series `record`, if tifffile
+        reports it as one contiguous uncompressed block."""
+        offset = getattr(record, 'dataoffset', None)
+        if offset is None:
+            return None
+        frame_size = int(np.prod(self._im_sz))
+        if frame_size == 0 or record.size % frame_size:
+            return None
+        # large ImageJ files may list only their first page
+        self._count = record.size // frame_size
+        dtype = np.dtype(self._dtype).newbyteorder(record.parent.byteorder)
+        return np.memmap(self._filename, dtype=dtype, mode='r',
+                         offset=offset, shape=(self._count, ) + self._im_sz)
+
+    def get_frame(self, j, region=None):
+        """Read frame j, or only a rectangular region of it.
+
+        Parameters
+        ----------
+        j : int
+        region : tuple of int, optional
+            ``(y0, y1, x0, x1)``: read only rows y0 up to y1 and columns
+            x0 up to x1 (exclusive). Only the tiles or strips of the page
+            that intersect the region are read and decoded.
+        """
+        t = self._page(j)
+        if region is not None:
+            data = self._read_region(j, t, region)
+        elif self._memmap is None:
+            data = t.asarray()
+        elif self._mmap and self._memmap.dtype.isnative:
+            data = self._memmap[j].view(np.ndarray)
+        else:
+            data = self._memmap[j].astype(self._dtype)
+        return Frame(data, frame_no=j, metadata=self._frame_metadata(t))
+
+    def _read_region(self, j, page, region):
+        key = page.keyframe
+        y0, y1, x0, x1 = region
+        if not (0 <= y0 < y1 <= key.imagelength and
+                0 <= x0 < x1 <= key.imagewidth):
+            raise ValueError("Region {} is out of the {} x {} frame".format(
+                region, key.imagelength, key.imagewidth))
+        crop = [slice(None)] * len(self._im_sz)
+        crop[key.axes.index('Y')] = slice(y0, y1)
+        crop[key.axes.index('X')] = slice(x0, x1)
+        crop = tuple(crop)
+
+        if self._memmap is not None:
+            return self._memmap[j][crop].astype(self._dtype)
+        if key.imagedepth != 1 or (key.planarconfig != 1 and
+                                   key.samplesperpixel != 1):
+            # unusual layouts: decode the whole frame
+            return page.asarray()[crop]
+
+        if key.is_tiled:
+            seg_length, seg_width = key.tilelength, key.tilewidth
+        else:
+            seg_width = key.imagewidth
+            seg_length = key.rowsperstrip or key.imagelength
+        across = -(-key.imagewidth // seg_width)
+        indices = [r * across + c
+                   for r in range(y0 // seg_length, (y1 - 1) // seg_length + 1)
+                   for c in range(x0 // seg_width, (x1 - 1) // seg_width + 1)]
+
+        # sparse files leave out empty segments: these read as the
+        # no-data value, like in tifffile
+        out = np.full((y1 - y0, x1 - x0, key.samplesperpixel),
+                      getattr(key, 'nodata', 0), dtype=self._dtype)
+        fh = self._tiff_file.filehandle
+        offsets = [page.dataoffsets[i] for i in indices]
+        bytecounts = [page.databytecounts[i] for i in indices]
+        for data, index in fh.read_segments(offsets, bytecounts, indices,
+                                            lock=fh.lock):
+            segment, (_, _, top, left, _), _ = key.decode(
+                data, index, jpegtables=key.jpegtables)
+            if segment is None:  # empty segment
+                continue
+            segment = segment[0]
+            # intersection of the segment and the region, in frame pixels
+            t, b = max(top, y0), min(top + segment.shape[0], y1)
+            l, r = max(left, x0), min(left + segment.shape[1], x1)
+            out[t - y0:b - y0, l - x0:r - x0] = \
+                segment[t - top:b - top, l - left:r - left]
+        if 'S' not in key.axes:
+            out = out[..., 0]
+        return out
+
+    def get_metadata(self, j):
+        """Return the metadata of frame j, read from the tags of its page.
+
+        Returns an empty dict if the reader was created with
+        ``metadata='none'``.
+        """
+        if self._metadata_mode == 'none':
+            return {}
+        return dict(self._cached_metadata(self._page(j)))
+
+    def _page(self, j):
+        # large ImageJ files may list only their first page
+        return self._tiff[j] if j < len(self._tiff) else self._tiff[0]
+
+    def _frame_metadata(self, page):
+        # Frame makes its own copy of the dict
+        if self._metadata_mode != 'full':
+            return None
+        return self._cached_metadata(page)
+
+    def _cached_metadata(self, page):
+        """Metadata of `page`, parsed once for each keyframe."""
+        key = page.keyframe.offset
+        try:
+            return self._metadata_cache[key]
+        except KeyError:
+            md = self._metadata_cache[key] = self._read_metadata(page)
+            return md
+
+    def get_frames(self, indices, max_workers=None):
+        """Read several frames at once into a single array.
+
+        Compressed pages are decoded in a pool of `max_workers` threads
+        (by default, as many as ``concurrent.futures`` chooses): tifffile's
+        codecs release the GIL, so this scales with the number of cores.
+
+        Parameters
+        ----------
+        indices : iterable of int
+            Frame numbers to read. Negative numbers count from the end.
+        max_workers : int, optional
+
+        Returns
+        -------
+        frames : ndarray
+            The frames, stacked along the first axis in the requested order.
+        """
+        indices = self._normalize_indices(indices)
+        if self._memmap is not None:
+            return self._memmap[indices].astype(self._dtype)
+
+        out = np.empty((len(indices), ) + self._im_sz, dtype=self._dtype)
+        # look up the pages here: loading them is not thread-safe
+        pages = [self._tiff[j] for j in indices]
+
+        def decode(k):
+            self._decode_page(pages[k], out[k])
+
+        with self._thread_pool(max_workers) as executor:
+            # consume the results to propagate exceptions
+            for _ in executor.map(decode, range(len(pages))):
+                pass
+        return out
+
+    def iter_frames(self, indices=None, max_workers=None):
+        """Iterate over frames, decoding the next ones in parallel.
+
+        Up to twice `max_workers` frames are decoded ahead of the one being
+        returned, in a pool of threads (see `get_frames`).
+
+        Parameters
+        ----------
+        indices : iterable of int, optional
+            Frame numbers to read. By default, all frames in order.
+        max_workers : int, optional
+        """
+        if indices is None:
+            indices = range(len(self))
+        indices = self._normalize_indices(indices)
+        if self._memmap is not None:
+            for j in indices:
+                yield self.get_frame(j)
+            return
+
+        window = 2 * (max_workers or os.cpu_count() or 1)
+        ahead = deque()
+        with self._thread_pool(max_workers) as executor:
+            try:
+                for j in indices:
+                    page = self._tiff[j]
+                    ahead.append((j, page, executor.submit(self._decode_page,
+                                                           page)))
+                    if len(ahead) >= window:
+                        yield self._make_frame(*ahead.popleft())
+                while ahead:
+                    yield self._make_frame(*ahead.popleft())
+            finally:
+                # do not decode frames nobody will ask for
+                for _, _, future in ahead:
+                    future.cancel()
+
+    def _normalize_indices(self, indices):
+        indices = np.asarray(indices, dtype=np.intp).reshape(-1)
+        indices = np.where(indices < 0, indices + len(self), indices)
+        if np.any((indices < 0) | (indices >= len(self))):
+            raise IndexError("Frame number out of range.")
+        return indices
+
+    def _thread_pool(self, max_workers):
+        # file reads of the threads are synchronized by tifffile
+        self._tiff_file.filehandle.set_lock(True)
+        return ThreadPoolExecutor(max_workers)
+
+    @staticmethod
+    def _decode_page(page, out=None):
+        # decode the page in the calling thread only
+        return page.asarray(out=out, maxworkers=1)
+
+    def _make_frame(self, j, page, future):
+        return Frame(future.result(), frame_no=j,
+                     metadata=self._frame_metadata(page))
+
+    def as_array(self):
+        """Return a read-only memory map of all frames, in the byte order
+        of the file. Only available when tifffile finds the pages stored
+        uncompressed in one contiguous block; raises ValueError otherwise."""
+        if self._memmap is None:
+            raise ValueError("The image data of {} is not stored contiguously "
+                             "and uncompressed".format(self._filename))
+        return self._memmap.view(np.ndarray)
 
     def _read_metadata(self, tiff):
         """Read metadata for current frame and return as dict"""
@@ -186,10 +486,11 @@ class TiffStack_tifffile(FramesSequence):
         return self._im_sz
 
     def __len__(self):
-        return len(self._tiff)
+        return self._count
 
     def close(self):
         self._tiff.parent.close()
+        self._memmap = None
         super().close()
 
     def __repr__(self):
@@ -381,33 +682,49 @@ class TiffStack_pil(FramesSequence):
             self._im_sz = (w, h, samples_per_px)
         else:
             self._im_sz = (w, h)
-        # walk through stack to get length, there has to
-        # be a better way to do this
+        if self._can_index_frames():
+            # index the image directories to get the length, without
+            # decoding their tags. Pillow seeks to any frame it already
+            # knows the position of at once; otherwise it would load all
+            # preceding directories.
+            with open(fname, 'rb') as fh:
+                ifd_offsets = _tiff_ifd_offsets(fh)
+            self._count = len(ifd_offsets)
+            self.im._frame_pos = ifd_offsets
+            self.im._n_frames = self._count
+        else:
+            self._count = self._count_frames()
+        self.cur = self.im.tell()
+
+    def _can_index_frames(self):
+        """Whether the frame positions can be given to Pillow. They are
+        stored in private attributes, which may change between versions."""
+        return (isinstance(getattr(self.im, '_frame_pos', None), list) and
+                hasattr(self.im, '_n_frames'))
+
+    def _count_frames(self):
+        """Count the frames with the public Pillow API."""
+        try:
+            return self.im.n_frames
+        except AttributeError:  # Pillow < 2.9
+            pass
         for j in itertools.count():
             try:
                 self.im.seek(j)
             except EOFError:
-                break
-
-        self._count = j
-        self.cur = self.im.tell()
+                return j
 
     def get_frame(self, j):
         '''Extracts the jth frame from the image sequence.
         if the frame does not exist return None'''
-        # PIL does not support random access. If we need to rewind, re-open
-        # the file.
-        if j < self.cur:
-            self.im.close()
-            self.im = Image.open(self._filename)
-            self.im.seek(j)
-        elif j > self.cur:
-            self.im.seek(j)
-        elif j > len(self):
+        if j >= len(self):
             raise IndexError("out of bounds; length is {0}".format(len(self)))
-        # If j == self.cur, do nothing.
-        self.cur = self.im.tell()
-        res = np.reshape(self.im.getdata(), self._im_sz)
+        if j != self.cur:
+            self.im.seek(j)
+            self.cur = self.im.tell()
+        res = np.array(self.im)
+        if not res.dtype.isnative:
+            res = res.astype(res.dtype.newbyteorder('='))
         return Frame(res, frame_no=j, metadata=self._read_metadata())
 
     def _read_metadata(self):
@@ -498,42 +815,78 @@ class TiffSeries(FramesSequence):
     offset : int, default 1
         The file number for frame 0.
 
+    cache_listing : bool, default False
+        Save the number of files found next to their directory (see
+        `pims.utils.sidecar`), so that opening the series again does not
+        list the directory while it is unchanged.
+
     '''
-    def __init__(self, name_template, offset=1):
+    def __init__(self, name_template, offset=1, cache_listing=False):
 
         self._name_template = name_template
         self._offset = offset
 
-        im = Image.open(self._name_template.format(ind=self._offset))
-        # get image dimensions from the meta data the order is flipped
-        # due to row major v col major ordering in tiffs and numpy
-        self._im_sz = (im.tag[0x101][0],
-                       im.tag[0x100][0])
+        with Image.open(self._name_template.format(ind=self._offset)) as im:
+            # get image dimensions from the meta data the order is flipped
+            # due to row major v col major ordering in tiffs and numpy
+            self._im_sz = (im.tag[0x101][0],
+                           im.tag[0x100][0])
 
-        res = im.tag[0x102][0]
-        self._dtype = _dtype_map.get(res, np.int16)
+            res = im.tag[0x102][0]
+            self._dtype = _dtype_map.get(res, np.int16)
 
-        try:
-            samples_per_pixel = im.tag[0x115][0]
-            if samples_per_pixel != 1:
-                raise ValueError("support for color not implemented")
-        except:
-            pass
-
-        j = 0
-        # sort out how many there are
-        while os.path.isfile(name_template.format(j + offset)):
-            j += 1
+            try:
+                samples_per_pixel = im.tag[0x115][0]
+                if samples_per_pixel != 1:
+                    raise ValueError("support for color not implemented")
+            except:
+                pass
 
-        self._count = j
+        self._count = self._count_files(cache_listing)
+
+    def _count_files(self, cache_listing):
+        """Count the files named after the template, from `offset` up to the
+        first missing number, with a single listing of their directory."""
+        directory, pattern = os.path.split(self._name_template)
+        directory = directory or os.curdir
+        cache_path = sidecar_path(directory)
+        if cache_listing:
+            cached = load_sidecar(cache_path, directory,
+                                  ('template', 'offset', 'count'))
+            if (cached is not None and
+                    str(cached['template']) == self._name_template and
+                    int(cached['offset']) == self._offset):
+                return int(cached['count'])
+
+        regex = _template_regex(pattern)
+        numbers = set()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                match = regex.match(entry.name)
+                # reformatting rejects numbers with the wrong padding
+                if (match is not None and entry.is_file() and
+                        pattern.format(ind=int(match.group(1))) == entry.name):
+                    numbers.add(int(match.group(1)))
+        count = 0
+        while count + self._offset in numbers:
+            count += 1
+
+        if cache_listing:
+            save_sidecar(cache_path, directory,
+                         template=np.array(self._name_template),
+                         offset=np.array(self._offset),
+                         count=np.array(count))
+        return count
 
     def get_frame(self, j):
         '''Extracts the jth frame from the image sequence.
         if the frame does not exist return None'''
 
-        im = Image.open(self._name_template.format(ind=j + self._offset))
-
-        return np.reshape(im.getdata(), self._im_sz)
+        with Image.open(self._name_template.format(ind=j + self._offset)) as im:
+            res = np.array(im)
+        if not res.dtype.isnative:
+            res = res.astype(res.dtype.newbyteorder('='))
+        return Frame(res, frame_no=j)
 
     @property
     def pixel_type(self):
@@ -559,6 +912,20 @@ Pixel Datatype: {dtype}""".format(w=self.frame_shape[0],
                                   dtype=self.pixel_type)
 
 
+def _template_regex(template):
+    """Compile a regex matching the names generated by `template`, a format
+    string with a single integer field `ind`, capturing the integer."""
+    parts = []
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        parts.append(re.escape(literal))
+        if field is not None:
+            if field != 'ind':
+                raise ValueError("The name template should only have an "
+                                 "'ind' field, not {!r}".format(field))
+            parts.append(r'\s*([-+]?\d+)')
+    return re.compile(''.join(parts) + '$')
+
+
 # needed for the wrapper classes
 def _parse_mm_xml_string(xml_str):
     """
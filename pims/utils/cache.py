@@ -0,0 +1,77 @@
+"""Least recently used cache of frames, bounded by their size in bytes."""
+from collections import OrderedDict
+from threading import Lock
+
+__all__ = ["FrameCache"]
+
+
+class FrameCache(object):
+    """Keep the most recently used frames in memory, up to a total size.
+
+    Frames are stored by key (typically the frame number). When adding a
+    frame brings the total size above `max_bytes`, the least recently used
+    frames are dropped. The number of lookups that found (`hits`) or did not
+    find (`misses`) their frame is counted.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Maximum total size of the cached frames. With 0, nothing is kept.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        """Return the frame stored for `key`, or None."""
+        with self._lock:
+            try:
+                value, _ = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, nbytes=None):
+        """Store a frame. Its size is `value.nbytes` unless given. Frames
+        larger than `max_bytes` are not stored."""
+        if nbytes is None:
+            nbytes = value.nbytes
+        with self._lock:
+            if key in self._items:
+                self.nbytes -= self._items.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return
+            self._items[key] = value, nbytes
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, size) = self._items.popitem(last=False)
+                self.nbytes -= size
+
+    def keys(self):
+        """Return the stored keys, from least to most recently used."""
+        with self._lock:
+            return list(self._items)
+
+    def clear(self):
+        """Drop all frames. The hit and miss counts are kept."""
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return ("<FrameCache: {} frames, {} of {} bytes, {} hits, {} misses>"
+                .format(len(self), self.nbytes, self.max_bytes, self.hits,
+                        self.misses))
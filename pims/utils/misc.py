@@ -1,3 +1,8 @@
+import os
+import struct
+from functools import lru_cache
+
+
 class FileLocker(object):
     """
     A context manager to lock and unlock a file
@@ -14,4 +19,91 @@ class FileLocker(object):
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.lock.release()
-        return False
\ No newline at end of file
+        return False
+
+
+def pread(file, size, offset, lock):
+    """Read `size` bytes at `offset` from an open binary file.
+
+    Where available, `os.pread` is used: it neither uses nor moves the file
+    position, so it is safe to call from several threads at once without
+    locking. Elsewhere, this falls back to seek and read while holding
+    `lock`, which should be the lock that guards all other uses of `file`.
+
+    Returns fewer than `size` bytes only at the end of the file.
+    """
+    if not hasattr(os, 'pread'):
+        with FileLocker(lock):
+            file.seek(offset)
+            return file.read(size)
+
+    fd = file.fileno()
+    data = os.pread(fd, size, offset)
+    if len(data) == size or len(data) == 0:
+        return data
+    # short read: keep reading until the end of the file
+    chunks = [data]
+    while size > len(data):
+        size -= len(data)
+        offset += len(data)
+        data = os.pread(fd, size, offset)
+        if not data:
+            break
+        chunks.append(data)
+    return b''.join(chunks)
+
+
+def pread_into(file, buffer, offset, lock):
+    """Fill the writable `buffer` (e.g. a numpy array) with bytes read at
+    `offset` from an open binary file, and return the number of bytes read.
+
+    Like `pread`, this does not depend on the file position when
+    `os.preadv` is available, and reads straight into `buffer` without an
+    intermediate copy. Elsewhere, it seeks and reads while holding `lock`.
+    """
+    view = memoryview(buffer).cast('B')
+    if not hasattr(os, 'preadv'):
+        data = pread(file, len(view), offset, lock)
+        view[:len(data)] = data
+        return len(data)
+
+    fd = file.fileno()
+    count = 0
+    while count < len(view):
+        n = os.preadv(fd, [view[count:]], offset + count)
+        if n == 0:
+            break
+        count += n
+    return count
+
+
+@lru_cache(maxsize=None)
+def _fields_struct(fields):
+    """Compile a sequence of (name, struct format) pairs into a single
+    little-endian struct, and the number of values each field unpacks to."""
+    counts = [len(struct.Struct('<' + fmt).unpack(
+              bytes(struct.calcsize('<' + fmt)))) for _, fmt in fields]
+    return struct.Struct('<' + ''.join(fmt for _, fmt in fields)), counts
+
+
+def fields_size(fields):
+    """Return the number of bytes taken by `fields` (see `unpack_fields`)."""
+    return _fields_struct(tuple(fields))[0].size
+
+
+def unpack_fields(fields, data, offset=0):
+    """Decode a binary header into a dict.
+
+    `fields` is a sequence of (name, struct format) pairs, laid out one after
+    the other in little-endian byte order starting at `offset` in `data`.
+    The whole header is decoded by one precompiled struct. Fields holding a
+    single value give that value, others (e.g. format '4i') give a tuple.
+    """
+    compiled, counts = _fields_struct(tuple(fields))
+    values = compiled.unpack_from(data, offset)
+    result = dict()
+    i = 0
+    for (name, _), count in zip(fields, counts):
+        result[name] = values[i] if count == 1 else values[i:i + count]
+        i += count
+    return result
@@ -0,0 +1,144 @@
+"""Read items ahead of sequential access, in worker threads."""
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock, Thread
+
+__all__ = ["Prefetcher", "ReadAhead"]
+
+
+class Prefetcher(object):
+    """Call ``func(j)`` for the items following the requested one, in a pool
+    of worker threads, so that they are ready when they are asked for.
+
+    After item j is requested, items j + 1 to j + `depth` are scheduled. At
+    most `depth` items are pending or held, which bounds memory use. When
+    the access jumps elsewhere, pending items outside the new window are
+    cancelled (or dropped, if they are already being read).
+
+    Parameters
+    ----------
+    func : callable
+        Reads item j. Must be safe to call from several threads at once.
+    length : int
+        Number of items: items past the end are not scheduled.
+    depth : int
+        Number of items to read ahead.
+    max_workers : int, optional
+        Number of worker threads. Defaults to `depth`.
+    """
+    def __init__(self, func, length, depth, max_workers=None):
+        self._func = func
+        self._length = length
+        self._depth = depth
+        self._executor = ThreadPoolExecutor(max_workers or depth)
+        self._pending = {}
+        self._lock = Lock()
+
+    def get(self, j):
+        """Return ``func(j)``, and schedule the items following j."""
+        with self._lock:
+            if self._executor is None:
+                raise ValueError("The prefetcher is closed.")
+            future = self._pending.pop(j, None)
+            window = range(j + 1, min(j + self._depth + 1, self._length))
+            for k in list(self._pending):
+                if k not in window:
+                    self._pending.pop(k).cancel()
+            for k in window:
+                if k not in self._pending:
+                    self._pending[k] = self._executor.submit(self._func, k)
+        if future is None:
+            return self._func(j)
+        return future.result()
+
+    def close(self):
+        """Cancel pending items and stop the worker threads."""
+        with self._lock:
+            if self._executor is None:
+                return
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+# marks the end of the items in a ReadAhead queue
+_END = object()
+
+
+class ReadAhead(object):
+    """Iterate over `iterable` in a worker thread, which keeps up to `depth`
+    items ready in a queue for the consumer.
+
+    The iterable must not be used by other threads until `close` returns.
+    Exceptions raised by the iterable are raised again in the consumer.
+
+    Parameters
+    ----------
+    iterable : iterable
+    depth : int
+        Maximum number of items waiting in the queue.
+    """
+    def __init__(self, iterable, depth):
+        self._queue = queue.Queue(depth)
+        self._stop = Event()
+        self._done = False
+        # the thread holds no reference to self, so that an unused ReadAhead
+        # is garbage collected, which stops the thread
+        self._thread = Thread(target=_read_ahead,
+                              args=(iter(iterable), self._queue, self._stop),
+                              daemon=True)
+        self._thread.start()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        item, error = self._queue.get()
+        if item is _END:
+            self._done = True
+            if error is not None:
+                raise error
+            raise StopIteration
+        return item
+
+    def close(self):
+        """Stop the worker thread and wait for it to finish."""
+        self._stop.set()
+        self._done = True
+        while self._thread.is_alive():
+            # unblock the worker if it waits for space in the queue
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._thread.join(0.01)
+
+    def __del__(self):
+        self._stop.set()
+
+
+def _read_ahead(iterator, items, stop):
+    error = None
+    try:
+        for item in iterator:
+            if not _put(items, (item, None), stop):
+                return
+    except Exception as e:
+        error = e
+    _put(items, (_END, error), stop)
+
+
+def _put(items, item, stop):
+    """Put item in the queue, unless stop is set first. Return whether the
+    item was put."""
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
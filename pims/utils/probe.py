@@ -0,0 +1,185 @@
+"""Read the shape and data type of an image from its file header, without
+decoding the image."""
+import os
+import struct
+
+import numpy as np
+
+__all__ = ["probe_image"]
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# PNG color type: number of channels. Paletted images (type 3) are
+# expanded by the decoder depending on their transparency: not probed.
+PNG_CHANNELS = {0: 1, 2: 3, 4: 2, 6: 4}
+
+# JPEG start of frame markers, excluding DHT (C4), JPG (C8) and DAC (CC)
+JPEG_SOF = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# TIFF (SampleFormat, BitsPerSample): dtype
+TIFF_DTYPES = {(1, 8): 'u1', (1, 16): 'u2', (1, 32): 'u4', (1, 64): 'u8',
+               (2, 8): 'i1', (2, 16): 'i2', (2, 32): 'i4', (2, 64): 'i8',
+               (3, 16): 'f2', (3, 32): 'f4', (3, 64): 'f8'}
+
+# TIFF field type: struct format of one value
+TIFF_TYPES = {1: 'B', 3: 'H', 4: 'I', 16: 'Q'}
+
+
+def probe_image(file):
+    """Return the shape and dtype of the array that reading an image file
+    with `pims.image_reader.imread` gives, reading only the file header.
+
+    The formats understood are 8-bit PNG (except paletted or transparent
+    images), 8-bit grayscale or RGB JPEG (without Exif data, which could
+    rotate the image) and single-page TIFF. For anything else, None is
+    returned and the image has to be decoded instead.
+
+    Parameters
+    ----------
+    file : string or file
+        Filename, or seekable binary file positioned at the start of the
+        image. The file position is restored afterwards.
+
+    Returns
+    -------
+    (shape, dtype) or None
+    """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as fh:
+            return probe_image(fh)
+    start = file.tell()
+    head = file.read(16)
+    try:
+        if head.startswith(PNG_SIGNATURE):
+            file.seek(start + len(PNG_SIGNATURE))
+            return _probe_png(file)
+        if head.startswith(b'\xff\xd8'):
+            file.seek(start + 2)
+            return _probe_jpeg(file)
+        if head[:4] in (b'II*\x00', b'MM\x00*', b'II+\x00', b'MM\x00+'):
+            return _probe_tiff(file, start, head)
+    except (struct.error, ValueError, KeyError):
+        pass  # truncated or malformed header
+    finally:
+        file.seek(start)
+    return None
+
+
+def _read(file, size):
+    data = file.read(size)
+    if len(data) < size:
+        raise ValueError("Unexpected end of file")
+    return data
+
+
+def _probe_png(file):
+    length, kind = struct.unpack('>I4s', _read(file, 8))
+    if kind != b'IHDR' or length != 13:
+        return None
+    width, height, depth, color = struct.unpack('>IIBB', _read(file, 10))
+    # 16-bit images are returned as uint16 or int32 depending on the
+    # Pillow version
+    channels = PNG_CHANNELS.get(color)
+    if channels is None or depth != 8:
+        return None
+    file.seek(7, 1)  # rest of IHDR and its CRC
+    # the chunks preceding the image data may add transparency
+    while True:
+        length, kind = struct.unpack('>I4s', _read(file, 8))
+        if kind == b'IDAT':
+            break
+        if kind == b'tRNS':
+            return None
+        file.seek(length + 4, 1)
+
+    if channels == 1:
+        return (height, width), np.dtype(np.uint8)
+    return (height, width, channels), np.dtype(np.uint8)
+
+
+def _probe_jpeg(file):
+    while True:
+        if _read(file, 1) != b'\xff':
+            return None
+        code = _read(file, 1)[0]
+        while code == 0xFF:  # fill bytes
+            code = _read(file, 1)[0]
+        if code == 0x01 or 0xD0 <= code <= 0xD7:  # markers without data
+            continue
+        if code in (0xD9, 0xDA):  # end of image or scan before the frame
+            return None
+        length, = struct.unpack('>H', _read(file, 2))
+        if code in JPEG_SOF:
+            precision, height, width, components = struct.unpack(
+                '>BHHB', _read(file, 6))
+            if precision != 8 or height == 0 or components not in (1, 3):
+                return None
+            if components == 1:
+                return (height, width), np.dtype(np.uint8)
+            return (height, width, 3), np.dtype(np.uint8)
+        if code == 0xE1:  # APP1
+            if _read(file, 4) == b'Exif':
+                return None
+            file.seek(length - 6, 1)
+        else:
+            file.seek(length - 2, 1)
+
+
+def _probe_tiff(file, start, head):
+    byteorder = '<' if head[:2] == b'II' else '>'
+    version, = struct.unpack(byteorder + 'H', head[2:4])
+    if version == 43:  # BigTIFF
+        count_fmt, entry_fmt, offset_fmt = 'Q', 'HHQ8s', 'Q'
+        offset, = struct.unpack(byteorder + 'Q', head[8:16])
+    else:
+        count_fmt, entry_fmt, offset_fmt = 'H', 'HHI4s', 'I'
+        offset, = struct.unpack(byteorder + 'I', head[4:8])
+    count_struct = struct.Struct(byteorder + count_fmt)
+    entry_struct = struct.Struct(byteorder + entry_fmt)
+    offset_struct = struct.Struct(byteorder + offset_fmt)
+
+    file.seek(start + offset)
+    count, = count_struct.unpack(_read(file, count_struct.size))
+    entries = _read(file, count * entry_struct.size)
+    next_offset, = offset_struct.unpack(_read(file, offset_struct.size))
+    if next_offset != 0:  # all pages are read into one array
+        return None
+
+    tags = dict()
+    for i in range(count):
+        code, kind, n, value = entry_struct.unpack_from(
+            entries, i * entry_struct.size)
+        if code not in (256, 257, 258, 262, 277, 284, 339):
+            continue
+        if kind not in TIFF_TYPES:
+            return None
+        fmt = byteorder + str(n) + TIFF_TYPES[kind]
+        size = struct.calcsize(fmt)
+        if size > len(value):  # stored elsewhere in the file
+            file.seek(start + offset_struct.unpack(value)[0])
+            value = _read(file, size)
+        tags[code] = struct.unpack_from(fmt, value)
+
+    width, = tags[256]
+    height, = tags[257]
+    samples = tags.get(277, (1,))[0]
+    bits = set(tags.get(258, (1,)))
+    sample_format = set(tags.get(339, (1,)))
+    photometric = tags.get(262, (None,))[0]
+    planar = tags.get(284, (1,))[0]
+    if len(bits) != 1 or len(sample_format) != 1:
+        return None
+    # palette and YCbCr images are converted by the decoder
+    if photometric not in (0, 1, 2):
+        return None
+    dtype = TIFF_DTYPES.get((sample_format.pop(), bits.pop()))
+    if dtype is None:
+        return None
+
+    if samples == 1:
+        shape = (height, width)
+    elif planar == 2:
+        shape = (samples, height, width)
+    else:
+        shape = (height, width, samples)
+    return shape, np.dtype(dtype)
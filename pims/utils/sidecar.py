@@ -0,0 +1,68 @@
+"""Small on-disk caches ("sidecars") that store an index of a file or
+directory next to it, so that it does not have to be rebuilt on every open.
+
+A sidecar is an .npz file holding some arrays and the size and modification
+time of the source it describes. It is ignored once the source changes.
+"""
+import os
+
+import numpy as np
+
+__all__ = ["sidecar_path", "load_sidecar", "save_sidecar"]
+
+
+def sidecar_path(source, kind=None):
+    """Return the default sidecar path for a file or directory `source`.
+
+    Readers that may index the same source differently give their own
+    `kind`, which becomes part of the file name.
+    """
+    suffix = '.pims.npz' if kind is None else '.{}.pims.npz'.format(kind)
+    source = os.path.abspath(source)
+    if os.path.isdir(source):
+        # writing into the directory itself would change its mtime
+        head, tail = os.path.split(source.rstrip(os.sep))
+        return os.path.join(head, '.' + tail + suffix)
+    return source + suffix
+
+
+def _signature(source):
+    st = os.stat(source)
+    return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+
+def load_sidecar(path, source, keys=()):
+    """Load the arrays saved by `save_sidecar` for `source`.
+
+    Returns a dict of arrays, or None if there is no sidecar at `path`, if
+    `source` changed since it was written or if it lacks any of `keys`.
+    """
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if not np.array_equal(data['_signature'], _signature(source)):
+                return None
+            if not set(keys).issubset(data.files):
+                return None
+            return {k: data[k] for k in data.files if k != '_signature'}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def save_sidecar(path, source, **arrays):
+    """Save `arrays` describing `source` to a sidecar at `path`.
+
+    Failures (e.g. a read-only directory) are not fatal: the sidecar is
+    only an optimization. Returns True if the sidecar was written.
+    """
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, _signature=_signature(source), **arrays)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+    return True
@@ -1,10 +1,9 @@
 import re
 
-__all__ = ["natural_keys"]
+__all__ = ["natural_keys", "natural_sort"]
 
-
-def _atoi(text):
-    return int(text) if text.isdigit() else text
+_DIGITS = re.compile(r'(\d+)')
+_LAST_NUMBER = re.compile(r'(.*?)(\d+)(\D*)$', re.DOTALL)
 
 
 def natural_keys(text):
@@ -18,4 +17,53 @@ def natural_keys(text):
     >>> print(alist)
     ['something1', 'something2', 'something12', 'something17']
     """
-    return [_atoi(c) for c in re.split(r'(\d+)', text)]
+    keys = _DIGITS.split(text)
+    # the numbers are at the odd positions
+    keys[1::2] = map(int, keys[1::2])
+    return keys
+
+
+def natural_sort(texts):
+    """Return a list of strings sorted like with `natural_keys`.
+
+    Numbered names that only differ by their last number, such as
+    'img_1.png', 'img_2.png', ..., are put in order of that number
+    directly, without building sort keys.
+    """
+    texts = list(texts)
+    ordered = _numeric_order(texts)
+    if ordered is None:
+        return sorted(texts, key=natural_keys)
+    return ordered
+
+
+def _numeric_order(texts):
+    """Order `texts` by their last number if they only differ by it and that
+    number is unique, else return None."""
+    if not texts:
+        return texts
+    match = _LAST_NUMBER.match(texts[0])
+    if match is None:
+        return None
+    prefix, suffix = match.group(1), match.group(3)
+    start, end = len(prefix), -len(suffix) or None
+    numbers = []
+    for text in texts:
+        digits = text[start:end]
+        if not (digits.isdecimal() and len(text) > len(prefix) + len(suffix)
+                and text.startswith(prefix) and text.endswith(suffix)):
+            return None
+        numbers.append(int(digits))
+
+    low = min(numbers)
+    if max(numbers) - low + 1 == len(texts):
+        # the numbers are consecutive: place each text at its position
+        ordered = [None] * len(texts)
+        for number, text in zip(numbers, texts):
+            if ordered[number - low] is not None:
+                return None
+            ordered[number - low] = text
+        return ordered
+    if len(set(numbers)) != len(numbers):
+        return None
+    return [text for _, text in sorted(zip(numbers, texts))]
@@ -0,0 +1,31 @@
+import numpy as np
+
+from pims.utils.cache import FrameCache
+
+
+def test_lru():
+    cache = FrameCache(30)
+    for i in range(3):
+        cache.put(i, np.full(10, i, np.uint8))
+    assert cache.get(0)[0] == 0
+    cache.put(3, np.zeros(10, np.uint8))  # the least recently used goes
+    assert cache.keys() == [2, 0, 3]
+    assert cache.nbytes == 30
+    assert cache.get(1) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_size():
+    cache = FrameCache(30)
+    cache.put(0, np.zeros(10, np.uint8))
+    cache.put(0, np.zeros(20, np.uint8))
+    assert cache.nbytes == 20
+    cache.put(1, np.zeros(15, np.uint8))
+    assert cache.keys() == [1]
+    # too large to be stored
+    cache.put(2, np.zeros(31, np.uint8))
+    assert 2 not in cache
+    cache.put(3, None, nbytes=10)
+    assert cache.nbytes == 25
+    cache.clear()
+    assert len(cache) == 0 and cache.nbytes == 0
@@ -0,0 +1,28 @@
+import pytest
+
+from pims.utils.prefetch import ReadAhead
+
+
+def test_read_ahead():
+    assert list(ReadAhead(range(100), 4)) == list(range(100))
+
+
+def test_read_ahead_error():
+    def items():
+        yield 0
+        raise ValueError("bad item")
+
+    read_ahead = ReadAhead(items(), 4)
+    assert next(read_ahead) == 0
+    with pytest.raises(ValueError):
+        next(read_ahead)
+    with pytest.raises(StopIteration):
+        next(read_ahead)
+
+
+def test_read_ahead_close():
+    read_ahead = ReadAhead(iter(range(1000)), 2)
+    assert next(read_ahead) == 0
+    read_ahead.close()
+    assert not read_ahead._thread.is_alive()
+    assert list(read_ahead) == []
@@ -0,0 +1,96 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from pims.image_reader import imread
+from pims.utils.probe import probe_image
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import tifffile
+except ImportError:
+    tifffile = None
+
+
+class TestProbeImage(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.rng = np.random.RandomState(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def check(self, filename, probed=True):
+        result = probe_image(filename)
+        if not probed:
+            assert result is None
+            return
+        data = imread(filename)
+        assert result == (data.shape, data.dtype)
+
+    def test_pil(self):
+        if Image is None:
+            raise unittest.SkipTest('PIL/Pillow not installed. Skipping.')
+        for mode, shape in [('L', (5, 7)), ('LA', (5, 7, 2)),
+                            ('RGB', (5, 7, 3)), ('RGBA', (5, 7, 4))]:
+            image = Image.fromarray(
+                self.rng.randint(0, 255, shape).astype(np.uint8), mode)
+            filename = os.path.join(self.tempdir, mode + '.png')
+            image.save(filename)
+            self.check(filename)
+            if mode in ('L', 'RGB'):
+                filename = os.path.join(self.tempdir, mode + '.jpg')
+                image.save(filename)
+                self.check(filename)
+                image.save(filename, progressive=True)
+                self.check(filename)
+
+        image = Image.fromarray(np.zeros((5, 7), np.uint8))
+        filename = os.path.join(self.tempdir, 'image.png')
+        # transparent and paletted images are converted by the decoder
+        image.save(filename, transparency=0)
+        self.check(filename, probed=False)
+        image.convert('P').save(filename)
+        self.check(filename, probed=False)
+        # Exif data may rotate the image
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        filename = os.path.join(self.tempdir, 'image.jpg')
+        image.save(filename, exif=exif)
+        self.check(filename, probed=False)
+
+    def test_tiff(self):
+        if tifffile is None:
+            raise unittest.SkipTest('tifffile not installed. Skipping.')
+        filename = os.path.join(self.tempdir, 'image.tif')
+        for dtype, shape, kwargs in [
+                (np.uint8, (5, 7), {}),
+                (np.int16, (5, 7), dict(byteorder='>')),
+                (np.float32, (5, 7), dict(bigtiff=True)),
+                (np.uint16, (5, 7, 3), dict(compression='zlib')),
+                (np.uint8, (3, 5, 7), dict(planarconfig='separate',
+                                           photometric='rgb'))]:
+            tifffile.imwrite(filename, np.ones(shape, dtype), **kwargs)
+            self.check(filename)
+        # all pages are read at once
+        tifffile.imwrite(filename, np.ones((2, 5, 7), np.uint8))
+        self.check(filename, probed=False)
+
+    def test_file_object(self):
+        if Image is None:
+            raise unittest.SkipTest('PIL/Pillow not installed. Skipping.')
+        buffer = io.BytesIO()
+        Image.fromarray(np.zeros((5, 7, 3), np.uint8)).save(buffer, 'png')
+        buffer.seek(0)
+        assert probe_image(buffer) == ((5, 7, 3), np.dtype(np.uint8))
+        assert buffer.tell() == 0
+        assert probe_image(io.BytesIO(buffer.getvalue()[:20])) is None
+        assert probe_image(io.BytesIO(b'not an image')) is None
@@ -1,7 +1,29 @@
-from pims.utils.sort import natural_keys
+from pims.utils.sort import natural_keys, natural_sort
 
 
 def test_natural_keys():
     alist = ["something1", "something12", "something17", "something2"]
     alist.sort(key=natural_keys)
     assert alist == ['something1', 'something2', 'something12', 'something17']
+
+
+def test_natural_sort():
+    cases = [
+        # consecutive numbers, placed directly
+        ['f_3.png', 'f_1.png', 'f_2.png', 'f_0.png'],
+        ['img007', 'img008', 'img009', 'img010'],
+        # gaps
+        ['f_30.png', 'f_1.png', 'f_2.png', 'f_100.png'],
+        # duplicate numbers
+        ['f_01.png', 'f_1.png', 'f_2.png'],
+        # different prefixes or suffixes
+        ['a1.png', 'b0.png', 'a2.png'],
+        ['f_2.png', 'f_1.tif', 'f_3.png'],
+        ['t1z2.png', 't2z1.png', 't1z1.png'],
+        # no numbers
+        ['b', 'a', 'c'],
+        ['x1', 'x', 'x2'],
+        [],
+    ]
+    for texts in cases:
+        assert natural_sort(texts) == sorted(texts, key=natural_keys)